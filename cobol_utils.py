@@ -1,24 +1,92 @@
 from __future__ import annotations
 from collections import UserString, OrderedDict
-from typing import Dict, Callable, Union, Any, List, Tuple
+from typing import Dict, Callable, Union, Any, List, Tuple, Iterator, BinaryIO
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import os
+import re
+import mmap
 import pandas as pd
 import numpy as np
 
 
 type_set = {'Comp', 'Text', 'Binary'}
 
+# largest number of decimal digits that always fits an int64, and a float64 without rounding
+_max_int_digits = 18
+_max_float_digits = 15
+
+def _decode_cells(cells: np.ndarray, decode_function: Callable[[bytes], Any]) -> List[Any]:
+    '''
+    Decode the (n_rows, length) matrix of cells one by one with the given scalar decode function.
+    '''
+    return [decode_function(cell.tobytes()) for cell in cells]
+
+def _unpack_nibbles(cells: np.ndarray) -> np.ndarray:
+    '''
+    Return the (n_rows, 2 * length) matrix of the half-bytes of the cells, most significant first.
+    '''
+    nibbles = np.empty((cells.shape[0], 2 * cells.shape[1]), dtype=np.uint8)
+    nibbles[:, 0::2] = cells >> 4
+    nibbles[:, 1::2] = cells & 0x0F
+    return nibbles
+
+def _digits_to_int(digits: np.ndarray) -> np.ndarray:
+    '''
+    Read each row of the matrix of decimal digits as an integer number.
+    '''
+    powers = 10 ** np.arange(digits.shape[1] - 1, -1, -1, dtype=np.int64)
+    return digits.astype(np.int64) @ powers
+
+def _read_exactly(file: BinaryIO, size: int) -> bytes:
+    '''
+    Read up to size bytes from the file, stopping earlier only at its end.
+    '''
+    chunks = []
+    while size > 0:
+        chunk = file.read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
 class Column(UserString):
 
-    def __init__(self, value: str, length: int, decode_function: Callable[[bytes], Any], params: Tuple[int]):
+    def __init__(self, value: str, length: int, decode_function: Callable[[bytes], Any], params: Tuple[int], decode_array_function: Callable[[np.ndarray], Any] = None):
         if value not in type_set:
             raise ValueError(f'"{value}" is not a known Cobol type, specify one among {type_set}')
         super().__init__(value)
         self._length = length
         self.decode = decode_function
+        self._decode_array = decode_array_function
         self._params = params
+        # set by the factories, whose columns are rebuilt identically from their type and parameters
+        self._standard = False
+
+    def decode_array(self, cells: np.ndarray) -> Any:
+        '''
+        Decode a (n_rows, length) uint8 matrix of cells at once, returning one value per row.
+        '''
+        if cells.ndim != 2 or cells.shape[1] != self._length:
+            raise Exception(f'Attempting to decode cells of shape {cells.shape} as {self!r}. {self._length} bytes per row are required.')
+        if self._decode_array is None:
+            return _decode_cells(cells, self.decode)
+        return self._decode_array(cells)
 
     def get_length(self) -> int:
         return self._length
+
+    def is_standard(self) -> bool:
+        '''
+        Return whether the column was built by Column.Comp, Column.Binary or Column.Text, so that its type and parameters define its decoding.
+        '''
+        return self._standard
+
+    def _set_standard(self) -> Column:
+        self._standard = True
+        return self
     
     def get_params(self) -> Tuple[int]:
         return self._params
@@ -37,14 +105,25 @@ class Column(UserString):
             if len(bytes) != length:
                 raise Exception(f'Attempting to decode {len(bytes)} bytes as Comp({integer_digits}, {decimal_digits}). {length} bytes are required.')
             s = bytes.hex()
-            sign = {'c': '+', 'd': '-'}[s[-1].lower()]
+            sign = {'c': '+', 'd': '-', 'f': '+'}[s[-1].lower()]
             integer_value = s[:-1-decimal_digits]
             decimal_value = s[-1-decimal_digits:-1]
             if decimal_digits == 0:
                 return int(sign + integer_value)
             else:
                 return float(sign + integer_value + '.' + decimal_value)
-        return Column('Comp', length=length, decode_function=decode, params=(integer_digits, decimal_digits))
+        def decode_array(cells: np.ndarray) -> Union[np.ndarray, List[Any]]:
+            nibbles = _unpack_nibbles(cells)
+            digits, signs = nibbles[:, :-1], nibbles[:, -1]
+            max_digits = _max_int_digits if decimal_digits == 0 else _max_float_digits
+            # fall back on the scalar decoding to reproduce its results (or errors) on what cannot be vectorized
+            if digits.shape[1] > max_digits or (digits > 9).any() or not np.isin(signs, (0x0C, 0x0D, 0x0F)).all():
+                return _decode_cells(cells, decode)
+            values = _digits_to_int(digits)
+            if decimal_digits != 0:
+                values = values / float(10 ** decimal_digits)
+            return np.where(signs == 0x0D, -values, values)
+        return Column('Comp', length=length, decode_function=decode, params=(integer_digits, decimal_digits), decode_array_function=decode_array)._set_standard()
     
     def Binary(digits: int) -> Column:
         if digits < 5:
@@ -61,38 +140,448 @@ class Column(UserString):
                 raise Exception(f'Attempting to decode {len(bytes)} bytes as Binary({digits}). {length} bytes are required.')
             s = bytes.hex()
             return int(s)
-        return Column('Binary', length=length, decode_function=decode, params=(digits,))
+        def decode_array(cells: np.ndarray) -> Union[np.ndarray, List[Any]]:
+            # the hexadecimal digits are read as decimal ones, consistently with decode
+            nibbles = _unpack_nibbles(cells)
+            if nibbles.shape[1] > _max_int_digits or (nibbles > 9).any():
+                return _decode_cells(cells, decode)
+            return _digits_to_int(nibbles)
+        return Column('Binary', length=length, decode_function=decode, params=(digits,), decode_array_function=decode_array)._set_standard()
     
     def Text(length: int) -> Column:
         def decode(bytes: bytes, cp='cp500') -> str:
             if len(bytes) != length:
                     raise Exception(f'Attempting to decode {len(bytes)} bytes as Text({length}). {length} bytes are required.')
             return bytes.decode(encoding=cp)
-        return Column('Text', length=length, decode_function=decode, params=(length,))
+        def decode_array(cells: np.ndarray, cp='cp500') -> List[str]:
+            # cp500 is a single-byte code page, so the decoded text keeps the cell boundaries
+            text = np.ascontiguousarray(cells).tobytes().decode(encoding=cp)
+            return [text[i:i + length] for i in range(0, len(text), length)] if length > 0 else [''] * len(cells)
+        return Column('Text', length=length, decode_function=decode, params=(length,), decode_array_function=decode_array)._set_standard()
 
-class Ebcdic:
-    def __init__(self, bytes: bytes, columns: OrderedDict[str, Column]):
-        self.cell_size = {name: c.get_length() for name, c in columns.items()}
+class RecordLayout:
+    '''
+    Compiled layout of a fixed-width record: offsets and sizes of the cells, the NumPy structured dtype viewing a record and the vectorized decoders of the columns.
+    Layouts are identified by the name, type and parameters of their columns: use RecordLayout.compile to reuse the same instance across calls.
+    Columns built with custom decoding functions are decoded by them, and a layout including any is equal only to itself.
+    '''
+
+    def __init__(self, columns: OrderedDict[str, Column]):
+        self.columns = OrderedDict(columns)
+        self.cell_size = {name: c.get_length() for name, c in self.columns.items()}
         self.row_length = sum(list(self.cell_size.values()))
-        if len(bytes) % self.row_length != 0:
-            raise Exception(f'The length of the rows for the given columns is {self.row_length}. The number of given bytes {bytes} is not a multiple.')
-        self.length = len(bytes) // self.row_length
+        if self.row_length == 0:
+            raise ValueError('The layout must include at least one byte per record.')
+        offsets = np.append([0], np.cumsum(list(self.cell_size.values())))[:-1]
+        self.offsets = {name: int(offset) for name, offset in zip(self.columns.keys(), offsets)}
+        self.dtype = np.dtype({'names': list(self.columns.keys()),
+            'formats': [('u1', (size,)) for size in self.cell_size.values()],
+            'offsets': list(self.offsets.values()),
+            'itemsize': self.row_length})
+        self.decoders = {name: c.decode_array for name, c in self.columns.items()}
+        self._key = RecordLayout.get_key(self.columns)
+        self.standard = all([c.is_standard() for c in self.columns.values()])
+
+    @staticmethod
+    def get_key(columns: OrderedDict[str, Column]) -> Tuple[Tuple[str, str, Tuple[int]], ...]:
+        '''
+        Return the hashable tuple (name, type, parameters) of the columns, identifying their layout.
+        '''
+        return tuple((name, str(c), tuple(c.get_params())) for name, c in columns.items())
+
+    @staticmethod
+    def compile(columns: Union[OrderedDict[str, Column], RecordLayout]) -> RecordLayout:
+        '''
+        Return the layout of the columns, compiling it only the first time it is requested in the process.
+        Columns with custom decoding functions are compiled on every call, as their decoding is not defined by the key.
+        '''
+        if isinstance(columns, RecordLayout):
+            return columns
+        if not all([c.is_standard() for c in columns.values()]):
+            return RecordLayout(columns)
+        return _compile_layout(RecordLayout.get_key(columns))
+
+    @staticmethod
+    def from_copybook(text: str) -> RecordLayout:
+        '''
+        Return the compiled layout of the record described by the COBOL copybook text.
+        '''
+        return RecordLayout.compile(parse_copybook(text))
+
+    def __hash__(self) -> int:
+        return hash(self._key)
+
+    def __eq__(self, other: Any) -> bool:
+        if self is other:
+            return True
+        return isinstance(other, RecordLayout) and self.standard and other.standard and self._key == other._key
+
+    def __repr__(self) -> str:
+        return 'RecordLayout(' + ', '.join([f'{name}={c!r}' for name, c in self.columns.items()]) + ')'
+
+    def get_records(self, buffer: Union[bytes, bytearray, memoryview, mmap.mmap]) -> np.ndarray:
+        '''
+        Return the structured array of the records in the buffer, without copying it.
+        Each field is the (n_rows, length) uint8 matrix of the cells of a column.
+        '''
+        buffer = memoryview(buffer).cast('B')
+        if len(buffer) % self.row_length != 0:
+            raise Exception(f'The length of the rows for the given columns is {self.row_length}. The number of given bytes {len(buffer)} is not a multiple.')
+        return np.frombuffer(buffer, dtype=self.dtype)
+
+    def decode(self, records: np.ndarray, drop_columns: List[str] = []) -> pd.DataFrame:
+        '''
+        Decode the structured array of records column by column.
+        '''
+        missing_columns = [c for c in drop_columns if c not in self.columns]
+        if len(missing_columns) > 0:
+            raise KeyError(f'{missing_columns} not found in axis')
+        data = {name: decode(records[name]) for name, decode in self.decoders.items() if name not in drop_columns}
+        return pd.DataFrame(data, columns=list(data.keys()), index=pd.RangeIndex(len(records)))
+
+@lru_cache(maxsize=None)
+def _compile_layout(key: Tuple[Tuple[str, str, Tuple[int]], ...]) -> RecordLayout:
+    columns = OrderedDict((name, getattr(Column, type)(*params)) for name, type, params in key)
+    return RecordLayout(columns)
+
+def _decode_shared_rows(memory_name: str, key: Tuple[Tuple[str, str, Tuple[int]], ...], start: int, stop: int, drop_columns: List[str]) -> pd.DataFrame:
+    '''
+    Decode the rows from start to stop of the records stored in the named shared memory block, in a worker process.
+    '''
+    layout = _compile_layout(key)
+    memory = shared_memory.SharedMemory(name=memory_name)
+    try:
+        records = np.ndarray((stop - start,), dtype=layout.dtype, buffer=memory.buf, offset=start * layout.row_length)
+        df = layout.decode(records, drop_columns=drop_columns)
+        del records
+    finally:
+        memory.close()
+    return df
+
+def _decode_file_rows(path: str, key: Tuple[Tuple[str, str, Tuple[int]], ...], start: int, stop: int, drop_columns: List[str]) -> pd.DataFrame:
+    '''
+    Decode the rows from start to stop of the records in the file, in a worker process mapping only their range in memory.
+    '''
+    layout = _compile_layout(key)
+    offset = start * layout.row_length
+    # a map must start at a multiple of the allocation granularity
+    map_offset = offset - offset % mmap.ALLOCATIONGRANULARITY
+    with open(path, 'rb') as file:
+        memory_map = mmap.mmap(file.fileno(), offset - map_offset + (stop - start) * layout.row_length, access=mmap.ACCESS_READ, offset=map_offset)
+    try:
+        records = np.ndarray((stop - start,), dtype=layout.dtype, buffer=memory_map, offset=offset - map_offset)
+        df = layout.decode(records, drop_columns=drop_columns)
+        del records
+    finally:
+        memory_map.close()
+    return df
+
+_picture_clauses = {'PIC', 'PICTURE'}
+_usage_clauses = {'DISPLAY': 'Text',
+    'COMP-3': 'Comp', 'COMPUTATIONAL-3': 'Comp', 'PACKED-DECIMAL': 'Comp',
+    'COMP': 'Binary', 'COMPUTATIONAL': 'Binary', 'COMP-4': 'Binary', 'COMPUTATIONAL-4': 'Binary', 'COMP-5': 'Binary', 'COMPUTATIONAL-5': 'Binary', 'BINARY': 'Binary'}
+
+class _CopybookItem:
+
+    def __init__(self, level: int, name: str, clauses: List[str]):
+        self.level = level
+        self.name = name
+        self.picture = None
+        self.usage = None
+        self.occurs = 1
+        self.redefines = None
+        self.sign_separate = False
+        self.children: List[_CopybookItem] = []
+        i = 0
+        while i < len(clauses):
+            clause = clauses[i]
+            if clause in _picture_clauses:
+                i += 2 if clauses[i+1] == 'IS' else 1
+                self.picture = clauses[i]
+            elif clause in _usage_clauses:
+                self.usage = clause
+            elif clause in {'COMP-1', 'COMPUTATIONAL-1', 'COMP-2', 'COMPUTATIONAL-2'}:
+                raise ValueError(f'"{name}": floating point usage {clause} is not supported.')
+            elif clause == 'OCCURS':
+                if 'DEPENDING' in clauses[i+2:]:
+                    raise ValueError(f'"{name}": variable-length OCCURS DEPENDING ON is not supported.')
+                i += 1
+                self.occurs = int(clauses[i])
+            elif clause == 'REDEFINES':
+                i += 1
+                self.redefines = clauses[i]
+            elif clause == 'SEPARATE':
+                self.sign_separate = True
+            elif clause == 'VALUE':
+                # the initial value does not affect the layout
+                break
+            i += 1
+
+    def get_column(self, usage: str=None) -> Column:
+        '''
+        Return the Column of the elementary item, according to its picture and usage. usage is the one inherited from the groups, overridden by the usage of the item.
+        '''
+        if self.picture is None:
+            raise ValueError(f'"{self.name}" is an elementary item without PIC clause.')
+        picture = re.sub(r'(.)\((\d+)\)', lambda m: m.group(1) * int(m.group(2)), self.picture.upper())
+        usage = self.usage if self.usage is not None else usage
+        type = _usage_clauses[usage] if usage is not None else 'Text'
+        if type == 'Text':
+            length = len(picture.replace('S', '').replace('V', '').replace('P', ''))
+            return Column.Text(length + (1 if self.sign_separate and 'S' in picture else 0))
+        if not re.fullmatch(r'S?9*(V9*)?', picture):
+            raise ValueError(f'"{self.name}": the picture {self.picture} is not supported with usage {usage}.')
+        integer_part, _, decimal_part = picture.lstrip('S').partition('V')
+        if type == 'Comp':
+            return Column.Comp(len(integer_part), len(decimal_part))
+        if len(decimal_part) > 0:
+            raise ValueError(f'"{self.name}": binary items with decimal digits are not supported.')
+        # Binary(9) spans 8 bytes while a 9-digit binary item spans 4, as Binary(8) does
+        digits = len(integer_part)
+        return Column.Binary(8 if digits == 9 else digits)
+
+def _get_copybook_entries(text: str) -> List[List[str]]:
+    '''
+    Split the copybook text into the lists of tokens of its entries, skipping comments, sequence and identification areas.
+    '''
+    lines = []
+    for line in text.splitlines():
+        # columns 73-80 are the identification area, whatever the sequence area holds
+        line = line[:72]
+        if re.match(r'\d{6}', line):
+            line = line[6:]
+        elif re.match(r'\s{6}[*/]', line):
+            line = line[6:]
+        if line.lstrip().startswith(('*', '/')):
+            continue
+        lines.append(line.split('*>')[0])
+    entries, entry = [], []
+    for token in re.findall(r'\'[^\']*\'|"[^"]*"|[^\s\'"]+', '\n'.join(lines)):
+        quoted = token.startswith(('\'', '"'))
+        if not quoted and token.endswith('.'):
+            token = token[:-1]
+            if token != '':
+                entry.append(token.upper())
+            if len(entry) > 0:
+                entries.append(entry)
+            entry = []
+        else:
+            entry.append(token if quoted else token.upper())
+    if len(entry) > 0:
+        raise ValueError(f'The copybook entry "{" ".join(entry)}" is not terminated by a period.')
+    return entries
+
+def _get_copybook_items(text: str) -> List[_CopybookItem]:
+    '''
+    Return the hierarchy of the items of the copybook, as a list of top-level items.
+    '''
+    roots: List[_CopybookItem] = []
+    stack: List[_CopybookItem] = []
+    for tokens in _get_copybook_entries(text):
+        if not tokens[0].isdigit():
+            raise ValueError(f'The copybook entry "{" ".join(tokens)}" does not start with a level number.')
+        level = int(tokens[0])
+        if level in {66, 88}:
+            # renames and condition names do not take any storage
+            continue
+        if len(tokens) > 1 and (tokens[1] in _picture_clauses or tokens[1] in _usage_clauses or tokens[1] in {'OCCURS', 'REDEFINES', 'VALUE', 'USAGE'}):
+            name, clauses = 'FILLER', tokens[1:]
+        else:
+            name, clauses = (tokens[1] if len(tokens) > 1 else 'FILLER'), tokens[2:]
+        item = _CopybookItem(level=level, name=name, clauses=clauses)
+        while len(stack) > 0 and (stack[-1].level >= level or level == 77):
+            stack.pop()
+        if len(stack) > 0:
+            stack[-1].children.append(item)
+        else:
+            roots.append(item)
+        stack.append(item)
+    return roots
+
+def parse_copybook(text: str) -> OrderedDict[str, Column]:
+    '''
+    Return the columns of the record described by the COBOL copybook text, in the format required by Ebcdic and RecordLayout.
+    PIC X and display numerics are decoded as Text, COMP-3 as Comp, COMP/COMP-4/COMP-5/BINARY as Binary.
+    Items with OCCURS are repeated with their subscripts in the name, as in "AMOUNT(1,2)"; fillers are named "FILLER-1", "FILLER-2"...;
+    items that REDEFINES another one are skipped, so the first definition of the storage is used.
+    Names already in use are qualified with their parent group, as in "CODE OF CUSTOMER".
+    '''
+    columns: OrderedDict[str, Column] = OrderedDict()
+    filler_count = 0
+    def add(item: _CopybookItem, subscripts: Tuple[int], parent: str, usage: str) -> None:
+        nonlocal filler_count
+        # the usage of a group applies to all its elementary items
+        usage = item.usage if item.usage is not None else usage
+        for i in range(1, item.occurs + 1):
+            item_subscripts = subscripts + ((i,) if item.occurs > 1 else ())
+            if len(item.children) > 0:
+                for child in item.children:
+                    if child.redefines is None:
+                        add(child, item_subscripts, item.name, usage)
+                continue
+            if item.name == 'FILLER':
+                filler_count += 1
+                name = f'FILLER-{filler_count}'
+            else:
+                name = item.name if parent is None or item.name not in columns else f'{item.name} OF {parent}'
+                if len(item_subscripts) > 0:
+                    name += '(' + ','.join([str(s) for s in item_subscripts]) + ')'
+            if name in columns:
+                raise ValueError(f'The copybook defines "{name}" more than once.')
+            columns[name] = item.get_column(usage)
+    for item in _get_copybook_items(text):
+        if item.redefines is None:
+            add(item, (), None, None)
+    if len(columns) == 0:
+        raise ValueError('The copybook does not define any elementary item.')
+    return columns
+
+class Ebcdic:
+    def __init__(self, bytes: Union[bytes, bytearray, memoryview, mmap.mmap], columns: Union[OrderedDict[str, Column], RecordLayout]):
+        '''
+        Wrap the records in bytes, which can be any object supporting the buffer protocol. The buffer is not copied.
+        The columns can be given as an ordered dictionary or as an already compiled RecordLayout.
+        '''
+        self.layout = RecordLayout.compile(columns)
+        self.cell_size = self.layout.cell_size
+        self.row_length = self.layout.row_length
+        self._records = self.layout.get_records(bytes)
+        self.length = len(self._records)
         self._bytes = bytes
-        self.columns = columns
+        self._buffer = memoryview(bytes).cast('B')
+        self.columns = self.layout.columns
+        self._owns_bytes = False
+        self._path = None
+
+    @staticmethod
+    def from_file(path: Union[str, os.PathLike], columns: Union[OrderedDict[str, Column], RecordLayout]) -> Ebcdic:
+        '''
+        Return an instance backed by a read-only memory map of the file, so that its content is paged in only when accessed.
+        The map is closed by close(), or on exit when the instance is used as a context manager.
+        '''
+        with open(path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                # an empty file cannot be memory-mapped
+                return Ebcdic(b'', columns)
+            memory_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            ebcdic = Ebcdic(memory_map, columns)
+        except Exception:
+            memory_map.close()
+            raise
+        ebcdic._owns_bytes = True
+        ebcdic._path = os.fspath(path)
+        return ebcdic
+
+    def close(self) -> None:
+        '''
+        Release the views on the bytes and close the memory map opened by from_file. The rows, matrices and columns returned before must be released first.
+        '''
+        self._records = None
+        self._buffer.release()
+        if self._owns_bytes:
+            self._bytes.close()
+        return
+
+    def __enter__(self) -> Ebcdic:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
 
     def __len__(self) -> int:
         return self.length        
 
-    def get_bytes(self) -> bytes:
+    def get_bytes(self) -> Union[bytes, bytearray, memoryview, mmap.mmap]:
         return self._bytes
-    
-    def get_DataFrame(self, drop_columns: List[str] = []) -> pd.DataFrame:
-        rows = np.array([self.get_bytes()[i * self.row_length:(i+1)*self.row_length] for i in range(len(self))])
-        chunk_points = np.append([0], np.cumsum(list(self.cell_size.values())))
-        def split_row(r: bytes) -> np.array[bytes]:
-            return np.array([r[chunk_points[i]: chunk_points[i+1]] for i in range(len(chunk_points)-1)], dtype=object)
-        rows = np.array([split_row(r) for r in rows], dtype=object)
-        df = pd.DataFrame(rows, columns=list(self.columns.keys()), dtype=object).drop(columns=drop_columns)
-        for c in df.columns:
-            df[c] = df[c].apply(lambda x: self.columns[c].decode(x))
-        return df
\ No newline at end of file
+
+    def get_buffer(self) -> memoryview:
+        '''
+        Return a flat memoryview on the bytes.
+        '''
+        return self._buffer
+
+    def get_row(self, i: int) -> memoryview:
+        '''
+        Return a view on the bytes of the i-th record.
+        '''
+        if not -len(self) <= i < len(self):
+            raise IndexError(f'Record {i} is out of range for {len(self)} records.')
+        i %= len(self)
+        return self._buffer[i * self.row_length:(i+1) * self.row_length]
+
+    def get_matrix(self) -> np.ndarray:
+        '''
+        Return the bytes as a (n_rows, row_length) uint8 matrix, without copying them.
+        '''
+        return np.frombuffer(self._buffer, dtype=np.uint8).reshape(len(self), self.row_length)
+
+    def get_column(self, name: str) -> np.ndarray:
+        '''
+        Return the (n_rows, length) uint8 matrix of the cells of the column, as a strided view on the bytes.
+        '''
+        if name not in self.columns:
+            raise KeyError(f'"{name}" does not match any of the columns.')
+        return self._records[name]
+
+    def get_DataFrame(self, drop_columns: List[str] = [], workers: int = 1) -> pd.DataFrame:
+        '''
+        Decode the records as a DataFrame.
+        With workers > 1, the records are split on record boundaries among a pool of processes, each decoding its own rows.
+        The processes map their rows of the file if the instance was built by from_file; otherwise the records are copied once into shared memory.
+        The processes rebuild the columns from their type and parameters, so columns with custom decoding functions are always decoded in this process.
+        '''
+        if workers < 1:
+            raise ValueError(f'workers must be a positive integer. Got {workers}.')
+        workers = min(workers, len(self)) if self.layout.standard else 1
+        if workers <= 1:
+            return self.layout.decode(self._records, drop_columns=drop_columns)
+        missing_columns = [c for c in drop_columns if c not in self.columns]
+        if len(missing_columns) > 0:
+            raise KeyError(f'{missing_columns} not found in axis')
+        bounds = np.linspace(0, len(self), workers + 1, dtype=int)
+        def decode(function: Callable[..., pd.DataFrame], source: str) -> List[pd.DataFrame]:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(function, source, RecordLayout.get_key(self.columns), int(start), int(stop), drop_columns)
+                    for start, stop in zip(bounds[:-1], bounds[1:])]
+                return [future.result() for future in futures]
+        if self._path is not None:
+            frames = decode(_decode_file_rows, self._path)
+        else:
+            memory = shared_memory.SharedMemory(create=True, size=len(self._buffer))
+            try:
+                memory.buf[:len(self._buffer)] = self._buffer
+                frames = decode(_decode_shared_rows, memory.name)
+            finally:
+                memory.close()
+                memory.unlink()
+        return pd.concat(frames, axis='index', ignore_index=True)
+
+    @staticmethod
+    def iter_chunks(source: Union[str, os.PathLike, BinaryIO, bytes, memoryview], columns: Union[OrderedDict[str, Column], RecordLayout], rows_per_chunk: int = 100000, drop_columns: List[str] = []) -> Iterator[pd.DataFrame]:
+        '''
+        Decode the records of the source lazily, yielding DataFrames of at most rows_per_chunk rows, indexed as the records in the source.
+        The source can be a file path, a binary file-like object or any buffer (bytes, bytearray, mmap, memoryview); only one chunk is held in memory at a time.
+        '''
+        if rows_per_chunk < 1:
+            raise ValueError(f'rows_per_chunk must be a positive integer. Got {rows_per_chunk}.')
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'rb') as file:
+                yield from Ebcdic.iter_chunks(file, columns=columns, rows_per_chunk=rows_per_chunk, drop_columns=drop_columns)
+            return
+        layout = RecordLayout.compile(columns)
+        row_length = layout.row_length
+        chunk_length = rows_per_chunk * row_length
+        if hasattr(source, 'read'):
+            chunks = iter(lambda: _read_exactly(source, chunk_length), b'')
+        else:
+            buffer = memoryview(source).cast('B')
+            chunks = (buffer[i:i + chunk_length] for i in range(0, len(buffer), chunk_length))
+        start = 0
+        for chunk in chunks:
+            if len(chunk) % row_length != 0:
+                raise Exception(f'The length of the rows for the given columns is {row_length}. The source ends with an incomplete record of {len(chunk) % row_length} bytes.')
+            df = Ebcdic(chunk, layout).get_DataFrame(drop_columns=drop_columns)
+            df.index = pd.RangeIndex(start, start + len(df))
+            start += len(df)
+            yield df
@@ -1,12 +1,79 @@
+from __future__ import annotations
 import os
+import io
+import json
 from azure.storage import filedatalake as dl
 from azure.identity import ManagedIdentityCredential, InteractiveBrowserCredential
 from custom_package import azure_function_utils as f_utils, dataframe_utils as df_utils
+from azure.storage.blob import BlobClient
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
 import datetime as dt
+import time
+from urllib.parse import urlsplit, urlunsplit
 from pytz import timezone
-from typing import List
+from typing import List, Callable, Iterable, Iterator, TypeVar, Tuple, Dict, BinaryIO, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 
+_T = TypeVar('_T')
+_R = TypeVar('_R')
+
+def _map_concurrently(function: Callable[[_T], _R], items: Iterable[_T], max_concurrency: int) -> List[_R]:
+    '''
+    Apply the function to the items in a pool of max_concurrency threads, and return the results in order.
+    The items are consumed lazily, so that at most 2 * max_concurrency of them are pending at any time.
+    '''
+    if max_concurrency < 1:
+        raise ValueError(f'max_concurrency must be a positive integer. Got {max_concurrency}.')
+    results = []
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= 2 * max_concurrency:
+                results.append(pending.popleft().result())
+        results.extend([future.result() for future in pending])
+    return results
+
+_throttling_status_codes = {429, 500, 503}
+
+def _retry(function: Callable[[], _R], retries: int=5, backoff: float=0.5) -> _R:
+    '''
+    Call the function, retrying with exponential backoff up to retries times when the service is throttling or unavailable.
+    '''
+    for attempt in range(retries + 1):
+        try:
+            return function()
+        except HttpResponseError as e:
+            if e.status_code not in _throttling_status_codes or attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+def _delete_paths(file_system_client: dl.FileSystemClient, paths: Iterable, max_concurrency: int) -> Tuple[int, int]:
+    '''
+    Delete the listed paths in a pool of max_concurrency threads: the files first, then the directories from the deepest level up.
+    A directory is deleted with all its content, so listing only the top level of a tree is enough to delete it. Paths already missing are ignored. Return the number of files and directories deleted.
+    '''
+    files, dirs = [], []
+    for p in paths:
+        (dirs if p.is_directory else files).append(p.name)
+    def delete(path: str, is_directory: bool) -> None:
+        try:
+            if is_directory:
+                _retry(file_system_client.get_directory_client(path).delete_directory)
+            else:
+                _retry(file_system_client.get_file_client(path).delete_file)
+        except ResourceNotFoundError:
+            pass
+    _map_concurrently(lambda path: delete(path, False), files, max_concurrency=max_concurrency)
+    levels: Dict[int, List[str]] = dict()
+    for d in dirs:
+        levels.setdefault(d.count('/'), []).append(d)
+    for level in sorted(levels, reverse=True):
+        _map_concurrently(lambda path: delete(path, True), levels[level], max_concurrency=max_concurrency)
+    return len(files), len(dirs)
+
 def get_container(storage_account_name: str, container_name: str) -> dl.FileSystemClient:
     '''
     Get the file system client given its name and its storage account
@@ -20,50 +87,212 @@ def get_container(storage_account_name: str, container_name: str) -> dl.FileSyst
             .format(storage_account_name), credential=key)\
         .get_file_system_client(file_system=container_name)
 
-def clear_directory(file_system_client: dl.FileSystemClient, dir: str) -> None:
+def clear_directory(file_system_client: dl.FileSystemClient, dir: str, recreate: bool=False, max_concurrency: int=8) -> None:
     '''
     Delete all the blobs from the specified directory
+    The entries directly under the directory are deleted by up to max_concurrency threads, retrying when throttled, each subdirectory being deleted recursively by the service in a single call: the directory itself keeps its ACLs and metadata.
+    With recreate, the directory is deleted recursively in a single call and created again empty, losing its ACLs and metadata.
     '''
-    paths = file_system_client.get_paths(path=dir + '/', recursive=True)
-    for path in paths:
-        file_system_client.get_file_client(path.name).delete_file()
-    f_utils.info(f'The directory "{dir}" has been cleaned.')
+    start = time.perf_counter()
+    if recreate:
+        _retry(file_system_client.get_directory_client(dir).delete_directory)
+        file_system_client.create_directory(dir)
+        f_utils.info(f'The directory "{dir}" has been cleaned by recreating it in {time.perf_counter() - start:.1f} s.')
+        return
+    n_files, n_dirs = _delete_paths(file_system_client, file_system_client.get_paths(path=dir, recursive=False), max_concurrency=max_concurrency)
+    f_utils.info(f'The directory "{dir}" has been cleaned: {n_files} files and {n_dirs} subdirectories with their content deleted in {time.perf_counter() - start:.1f} s.')
     return
 
-def collect_file_bytes(file_system_client: dl.FileSystemClient, path: str) -> dict[str, bytes]:
+class Manifest:
+    '''
+    Record of the files already fetched, as path -> (etag, last_modified, size) from the listing, to skip the unchanged ones in the next runs.
+    A file is recorded only after it has been handled, so a failed run fetches it again.
+    '''
+    def __init__(self, entries: Dict[str, Tuple[str, str, int]]=None) -> None:
+        self.entries = dict() if entries is None else {path: tuple(entry) for path, entry in entries.items()}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @staticmethod
+    def _get_entry(path: dl.PathProperties) -> Tuple[str, str, int]:
+        return (path.etag, path.last_modified.isoformat(), path.content_length)
+
+    def is_changed(self, path: dl.PathProperties) -> bool:
+        '''
+        Return whether the listed file is new or differs from the recorded one.
+        '''
+        return self.entries.get(path.name) != Manifest._get_entry(path)
+
+    def get_changed(self, paths: Iterable[dl.PathProperties]) -> List[dl.PathProperties]:
+        '''
+        Return the listed files that are new or changed, skipping the directories.
+        '''
+        return [p for p in paths if not p.is_directory and self.is_changed(p)]
+
+    def update(self, paths: Iterable[dl.PathProperties]) -> None:
+        for p in paths:
+            self.entries[p.name] = Manifest._get_entry(p)
+
+    def to_bytes(self) -> bytes:
+        return json.dumps(self.entries, indent=0, sort_keys=True).encode()
+
+    @staticmethod
+    def from_bytes(bytes: bytes) -> Manifest:
+        return Manifest(json.loads(bytes))
+
+    @staticmethod
+    def load(path: str, file_system_client: Optional[dl.FileSystemClient]=None) -> Manifest:
+        '''
+        Read the manifest from the path in the data lake, or from the local path if no file_system_client is given. A missing manifest is empty.
+        '''
+        if file_system_client is None:
+            if not os.path.exists(path):
+                return Manifest()
+            with open(path, 'rb') as file:
+                return Manifest.from_bytes(file.read())
+        file_client = file_system_client.get_file_client(path)
+        if not file_client.exists():
+            return Manifest()
+        return Manifest.from_bytes(file_client.download_file().readall())
+
+    def save(self, path: str, file_system_client: Optional[dl.FileSystemClient]=None) -> None:
+        '''
+        Write the manifest to the path in the data lake, or to the local path if no file_system_client is given.
+        '''
+        if file_system_client is None:
+            with open(path, 'wb') as file:
+                file.write(self.to_bytes())
+            return
+        file_system_client.get_file_client(path).upload_data(self.to_bytes(), overwrite=True)
+        return
+
+def collect_file_bytes(file_system_client: dl.FileSystemClient, path: str, max_concurrency: int=8, max_concurrency_per_file: int=1, manifest: Manifest=None) -> dict[str, bytes]:
     '''
     Return a dictionary {file_name -> bytes} for all the files that matches the specified starting path.
+    The files are downloaded by up to max_concurrency threads, each download using up to max_concurrency_per_file connections (useful for large files).
+    With a manifest, only the files that are new or changed since it was updated are downloaded, and then recorded in it.
     '''
+    listed = list(file_system_client.get_paths(path=path, recursive=True))
+    if manifest is not None:
+        listed = manifest.get_changed(listed)
+    paths = [p.name for p in listed]
+    def download(path: str) -> bytes:
+        file_client = file_system_client.get_file_client(path)
+        return file_client.download_file(max_concurrency=max_concurrency_per_file).readall()
     result = dict()
-    paths = file_system_client.get_paths(path=path, recursive=True)
-    for path in paths:
-        path = path.name
+    for path, file_bytes in zip(paths, _map_concurrently(download, paths, max_concurrency=max_concurrency)):
         file_name = path.split('/')[-1]
-        # copy the file
-        file_client = file_system_client.get_file_client(path)
-        file_bytes = file_client.download_file().readall()
         result[file_name] = file_bytes
+    if manifest is not None:
+        manifest.update(listed)
     return result
 
-def delete_files(file_system_client: dl.FileSystemClient, path: str) -> None:
+class _ChunksReader(io.RawIOBase):
+    '''
+    Raw binary stream over an iterator of byte chunks, holding a single chunk at a time.
+    '''
+    def __init__(self, chunks: Iterator[bytes]) -> None:
+        self._chunks = chunks
+        self._chunk = memoryview(b'')
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: memoryview) -> int:
+        while len(self._chunk) == 0:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._chunk = memoryview(chunk)
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+def open_file(file_system_client: dl.FileSystemClient, path: str, max_concurrency: int=1) -> BinaryIO:
+    '''
+    Return a binary stream reading the file chunk by chunk while it is downloaded.
+    '''
+    downloader = file_system_client.get_file_client(path).download_file(max_concurrency=max_concurrency)
+    return io.BufferedReader(_ChunksReader(downloader.chunks()))
+
+def iter_file_streams(file_system_client: dl.FileSystemClient, path: str, max_concurrency_per_file: int=1, manifest: Manifest=None) -> Iterator[Tuple[str, BinaryIO]]:
+    '''
+    Yield (file_name, stream) for all the files that matches the specified starting path, as collect_file_bytes does without holding their bytes.
+    Each file is downloaded only while its stream is read, and the stream is closed when the next file is requested.
+    With a manifest, only the new or changed files are yielded, each recorded in it once the next file is requested.
+    '''
+    for p in file_system_client.get_paths(path=path, recursive=True):
+        if not p.is_directory and (manifest is None or manifest.is_changed(p)):
+            with open_file(file_system_client, p.name, max_concurrency=max_concurrency_per_file) as stream:
+                yield p.name.split('/')[-1], stream
+            if manifest is not None:
+                manifest.update([p])
+
+def delete_files(file_system_client: dl.FileSystemClient, path: str, max_concurrency: int=8) -> None:
     '''
     Delete all the files that matches the specified starting path.
+    The paths are deleted by up to max_concurrency threads, retrying when throttled.
     '''
-    paths = file_system_client.get_paths(path)
-    for p in paths:
-        file_system_client.delete_file(p.name)
-    f_utils.info('"{}" has been cleaned.'.format(path.strip('/')))
+    start = time.perf_counter()
+    n_files, n_dirs = _delete_paths(file_system_client, file_system_client.get_paths(path), max_concurrency=max_concurrency)
+    f_utils.info('"{}" has been cleaned: {} files and {} directories deleted in {:.1f} s.'.format(path.strip('/'), n_files, n_dirs, time.perf_counter() - start))
     return
 
 def delete_directory(file_system_client: dl.FileSystemClient, dir: str)-> None:
     dir_client = file_system_client.get_directory_client(dir)
     dir_client.delete_directory()
 
-def backup_files(file_system_client: dl.FileSystemClient, path: str, sink_dir: str, hierarchy: str='Ymd') -> None:
+backup_modes = {'stream', 'copy', 'move'}
+
+def _get_blob_client(file_client: dl.DataLakeFileClient) -> BlobClient:
+    '''
+    Return the client of the file on the blob endpoint of its storage account, which exposes the server-side copy.
+    '''
+    url = urlsplit(file_client.url)
+    url = url._replace(netloc=url.netloc.replace('.dfs.', '.blob.', 1))
+    return BlobClient.from_blob_url(urlunsplit(url), credential=file_client.credential)
+
+def copy_file(source_client: dl.DataLakeFileClient, sink_client: dl.DataLakeFileClient, poll_interval: float=1) -> None:
+    '''
+    Copy the source file into the sink on the storage side, waiting for the copy to complete. The bytes never pass through the caller.
+    '''
+    source = _get_blob_client(source_client)
+    sink = _get_blob_client(sink_client)
+    status = sink.start_copy_from_url(source.url)['copy_status']
+    while status == 'pending':
+        time.sleep(poll_interval)
+        status = sink.get_blob_properties().copy.status
+    if status != 'success':
+        raise Exception(f'The copy of "{source_client.path_name}" into "{sink_client.path_name}" ended with status "{status}".')
+    return
+
+def stream_file(source_client: dl.DataLakeFileClient, sink_client: dl.DataLakeFileClient, max_concurrency: int=1) -> None:
+    '''
+    Copy the source file into the sink chunk by chunk, holding a single chunk in memory at a time.
+    '''
+    downloader = source_client.download_file(max_concurrency=max_concurrency)
+    sink_client.create_file()
+    offset = 0
+    for chunk in downloader.chunks():
+        sink_client.append_data(chunk, offset=offset, length=len(chunk))
+        offset += len(chunk)
+    sink_client.flush_data(offset)
+    return
+
+def backup_files(file_system_client: dl.FileSystemClient, path: str, sink_dir: str, hierarchy: str='Ymd', mode: str='stream', max_concurrency: int=8, manifest: Manifest=None) -> None:
     '''
     Create the directory YYYY-mm-dd (according to hierarchy) in the specified sink_dir, and perform a back-up of the files that match the prefix path, appending the timestamp to the name of each file.
     in hierarchy, include 'Y' if you want to add a year-level parent; 'm' for the month-level parent; 'd' for the day-level parent.
+    The files are backed up by up to max_concurrency threads, according to mode:
+        'stream' pipes each file through the function chunk by chunk, with bounded memory;
+        'copy' copies each file on the storage side (blob copy), so its bytes never reach the function;
+        'move' renames each file into the backup directory, removing it from path.
+    With a manifest, only the files that are new or changed since it was updated are backed up, and then recorded in it.
     '''
+    if mode not in backup_modes:
+        raise ValueError(f'"{mode}" is not a known backup mode, specify one among {backup_modes}.')
     timestamp = dt.datetime.now(timezone('Europe/Rome'))
     sink_path = sink_dir
     if 'Y' in hierarchy:
@@ -73,27 +302,50 @@ def backup_files(file_system_client: dl.FileSystemClient, path: str, sink_dir: s
     if 'd' in hierarchy:
         sink_path = os.path.join(sink_path, timestamp.strftime('%Y-%m-%d'))
     datetime_string = timestamp.strftime('%Y-%m-%dT%H:%M:%S')
-    # copy-paste the content of the input folder in the day directory
-    file_bytes_dict = collect_file_bytes(file_system_client=file_system_client, path=path)
-    for full_name, file_bytes in file_bytes_dict.items():
-        file_name, extension = os.path.splitext(full_name)
-        period_file_client = file_system_client.create_file(os.path.join(sink_path, file_name + '-' + datetime_string + extension))
-        period_file_client.upload_data(file_bytes, overwrite=True)
+    # copy-paste the content of the input folder in the day directory, files with the same name overwrite each other as they share the sink
+    listed = [p for p in file_system_client.get_paths(path=path, recursive=True) if not p.is_directory]
+    if manifest is not None:
+        listed = manifest.get_changed(listed)
+    sink_paths: Dict[str, Tuple[str, str]] = dict()
+    for p in listed:
+        file_name, extension = os.path.splitext(p.name.split('/')[-1])
+        sink_paths[file_name + extension] = (p.name, os.path.join(sink_path, file_name + '-' + datetime_string + extension))
+    def backup(paths: Tuple[str, str]) -> None:
+        source_client = file_system_client.get_file_client(paths[0])
+        if mode == 'move':
+            source_client.rename_file(f'{file_system_client.file_system_name}/{paths[1]}')
+        elif mode == 'copy':
+            copy_file(source_client, file_system_client.get_file_client(paths[1]))
+        else:
+            stream_file(source_client, file_system_client.get_file_client(paths[1]))
+    if mode == 'move' and len(sink_paths) > 0:
+        # unlike the writes of the other modes, a rename does not create the parent directories of its destination
+        file_system_client.create_directory(sink_path)
+    _map_concurrently(backup, sink_paths.values(), max_concurrency=max_concurrency)
+    if manifest is not None:
+        # the files shadowed by a later one with the same name have not been backed up
+        handled = {source for source, _ in sink_paths.values()}
+        manifest.update([p for p in listed if p.name in handled])
     f_utils.info(f'Input raw files have been pasted into the directory "{sink_path}".')
     return
 
-def backup_splitted_df(file_system_client: dl.FileSystemClient, columns: List[str], df: pd.DataFrame, dir: str, file_name: str) -> None:
+def backup_splitted_df(file_system_client: dl.FileSystemClient, columns: List[str], df: pd.DataFrame, dir: str, file_name: str, max_concurrency: int=8, format: str='csv') -> None:
     '''
     split the dataframe by the specified columns and save the result as csv's in the specified dir, in the path built according to columns
-    '''    
+    The partitions are computed in a single pass, then serialized and uploaded by up to max_concurrency threads.
+    Use format 'parquet' or 'feather' to store the partitions with their dtypes instead of csv's.
+    '''
+    if format not in df_utils.file_formats:
+        raise ValueError(f'"{format}" is not a known file format, specify one among {df_utils.file_formats}.')
     timestamp = dt.datetime.now(timezone('Europe/Rome')).strftime('%Y-%m-%dT%H:%M:%S')
     sink_directory_client = file_system_client.get_directory_client(dir)
     if not sink_directory_client.exists():
         sink_directory_client.create_directory()
-    split_dict = df_utils.split_by_columns(df, columns)
-    for k, v in split_dict.items():
+    def upload(split: Tuple[Tuple[str], pd.DataFrame]) -> None:
+        k, v = split
         base_name = '/'.join(k) + '/' + file_name
-        file_client = sink_directory_client.get_file_client(f'{base_name}-{timestamp}.csv')
+        file_client = sink_directory_client.get_file_client(f'{base_name}-{timestamp}.{format}')
         file_client.create_file()
-        file_client.upload_data(v.to_csv(na_rep='NULL', index=False).encode(), overwrite=True)
+        file_client.upload_data(df_utils.get_bytes(v, format=format), overwrite=True)
+    _map_concurrently(upload, df_utils.iter_splits(df, columns), max_concurrency=max_concurrency)
     return
\ No newline at end of file
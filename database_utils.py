@@ -1,17 +1,152 @@
+from __future__ import annotations
 import pyodbc
 import os
+import time
+import uuid
+import datetime
+import decimal
+import threading
+from functools import lru_cache
+from contextlib import contextmanager
+import numpy as np
 import pandas as pd
+from typing import Iterator, Dict, List, Any, Union, Tuple, ContextManager, TYPE_CHECKING
+if TYPE_CHECKING:
+    # importing filety loads the category specifications, which the queries do not need
+    from custom_package.filety import DataType as dt, Table
 
-def connect_DB(server_name: str, database_name: str) -> pyodbc.Connection:
+# dtypes of the columns by the python type pyodbc reports in cursor.description, the others are kept as objects
+# datetimes take the unit execute_query gets from DataFrame.from_records: nanoseconds before pandas 3, microseconds since
+_datetime_dtype = 'datetime64[us]' if int(pd.__version__.split('.')[0]) >= 3 else 'datetime64[ns]'
+_column_dtypes: Dict[type, str] = {int: 'Int64', float: 'float64', bool: 'boolean', datetime.datetime: _datetime_dtype}
+_decimal_precision = 38
+_max_nvarchar_length = 4000
+
+@lru_cache(maxsize=None)
+def get_connection_string(server_name: str, database_name: str) -> str:
+    '''
+    Build the connection string once per process: a change of the credentials in the environment needs a new process or get_connection_string.cache_clear().
+    '''
     connection_string = r'DRIVER={ODBC Driver 17 for SQL Server};' + 'SERVER={};DATABASE={};'.format(server_name, database_name)
     if os.getenv("MSI_SECRET"):
         connection_string += 'Authentication=ActiveDirectoryMsi;'
     else:
         pw = os.getenv('DBpassword')
         connection_string += 'UID=agresso-adm;PWD={}'.format(pw)
-    cnxn = pyodbc.connect(connection_string)
+    return connection_string
+
+def connect_DB(server_name: str, database_name: str) -> pyodbc.Connection:
+    cnxn = pyodbc.connect(get_connection_string(server_name, database_name))
     return cnxn
 
+class ConnectionPool:
+    '''
+    Pool of the connections of the process keyed by (server_name, database_name), so that warm invocations reuse them instead of connecting (and acquiring a token) again.
+    Idle connections are closed after idle_timeout seconds and checked with SELECT 1 before reuse. At most max_size connections per key are in use at a time; connection() waits for one to be released.
+    '''
+    def __init__(self, max_size: int=4, idle_timeout: float=300) -> None:
+        if max_size < 1:
+            raise ValueError(f'max_size must be a positive integer. Got {max_size}.')
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._idle: Dict[Tuple[str, str], List[Tuple[pyodbc.Connection, float]]] = dict()
+        self._semaphores: Dict[Tuple[str, str], threading.BoundedSemaphore] = dict()
+
+    @staticmethod
+    def _is_healthy(cnxn: pyodbc.Connection) -> bool:
+        try:
+            with cnxn.cursor() as cursor:
+                cursor.execute('SELECT 1').fetchone()
+            return True
+        except pyodbc.Error:
+            return False
+
+    @staticmethod
+    def _close(cnxn: pyodbc.Connection) -> None:
+        try:
+            cnxn.close()
+        except pyodbc.Error:
+            pass
+
+    def _pop_idle(self, key: Tuple[str, str]) -> pyodbc.Connection:
+        '''
+        Return the most recently used idle connection of the key, closing the ones idle for longer than idle_timeout, or None if there is none left.
+        '''
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            expired = [cnxn for cnxn, last_used in idle if now - last_used > self.idle_timeout]
+            idle[:] = [(cnxn, last_used) for cnxn, last_used in idle if now - last_used <= self.idle_timeout]
+            cnxn = idle.pop()[0] if len(idle) > 0 else None
+        for expired_cnxn in expired:
+            ConnectionPool._close(expired_cnxn)
+        return cnxn
+
+    def _get(self, key: Tuple[str, str]) -> pyodbc.Connection:
+        cnxn = self._pop_idle(key)
+        while cnxn is not None:
+            if ConnectionPool._is_healthy(cnxn):
+                return cnxn
+            ConnectionPool._close(cnxn)
+            cnxn = self._pop_idle(key)
+        return connect_DB(*key)
+
+    @contextmanager
+    def connection(self, server_name: str, database_name: str) -> Iterator[pyodbc.Connection]:
+        '''
+        Yield a connection to the database, returned to the pool on exit after rolling back what was not committed. A connection that raised a pyodbc error is closed.
+        '''
+        key = (server_name, database_name)
+        with self._lock:
+            semaphore = self._semaphores.setdefault(key, threading.BoundedSemaphore(self.max_size))
+        with semaphore:
+            cnxn = self._get(key)
+            healthy = True
+            try:
+                yield cnxn
+            except pyodbc.Error:
+                healthy = False
+                raise
+            finally:
+                if healthy:
+                    try:
+                        cnxn.rollback()
+                    except pyodbc.Error:
+                        healthy = False
+                if healthy:
+                    with self._lock:
+                        self._idle.setdefault(key, []).append((cnxn, time.monotonic()))
+                else:
+                    ConnectionPool._close(cnxn)
+
+    def close(self) -> None:
+        '''
+        Close all the idle connections of the pool.
+        '''
+        with self._lock:
+            idle = [cnxn for connections in self._idle.values() for cnxn, _ in connections]
+            self._idle.clear()
+        for cnxn in idle:
+            ConnectionPool._close(cnxn)
+        return
+
+    def __enter__(self) -> ConnectionPool:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+_pool = ConnectionPool()
+
+def connection(server_name: str, database_name: str) -> ContextManager[pyodbc.Connection]:
+    '''
+    Return a context manager yielding a connection from the pool shared by the process, for example:
+        with database_utils.connection(server_name, database_name) as cnxn:
+            df = database_utils.execute_query(cnxn, query)
+    '''
+    return _pool.connection(server_name=server_name, database_name=database_name)
+
 def execute_query(cnxn: pyodbc.Connection, query: str)-> pd.DataFrame:
     with cnxn.cursor() as cursor:
         cursor.execute(query)
@@ -19,3 +154,159 @@ def execute_query(cnxn: pyodbc.Connection, query: str)-> pd.DataFrame:
         columns = [column[0] for column in cursor.description]
         df = pd.DataFrame.from_records(rows, columns=columns)
     return df
+
+
+def _get_column_dtypes(description: List[tuple]) -> Dict[str, str]:
+    return {column[0]: _column_dtypes.get(column[1], 'object') for column in description}
+
+def _get_chunk(rows: List[Any], dtypes: Dict[str, str]) -> pd.DataFrame:
+    '''
+    Build the DataFrame column by column from the rows, with the given dtypes whatever the values (NULLs included).
+    '''
+    columns = list(zip(*rows)) if len(rows) > 0 else [()] * len(dtypes)
+    data = dict()
+    for (name, dtype), values in zip(dtypes.items(), columns):
+        if dtype == 'object':
+            array = np.empty(len(values), dtype=object)
+            array[:] = values
+            # a Series keeps the object dtype, that the DataFrame constructor may infer as strings
+            data[name] = pd.Series(array, dtype=object, copy=False)
+        else:
+            data[name] = pd.Series(pd.array(values, dtype=dtype), copy=False)
+    return pd.DataFrame(data, columns=list(dtypes), copy=False)
+
+def iter_query(cnxn: pyodbc.Connection, query: str, arraysize: int=10000) -> Iterator[pd.DataFrame]:
+    '''
+    Execute the query and yield its result in DataFrames of at most arraysize rows, fetched one at a time, indexed as the rows in the result.
+    The dtypes of the columns are the same in every chunk, set from the types in the cursor description: integers are Int64, floats float64, bits boolean, datetimes datetime64 as in execute_query, the rest objects.
+    A query returning no rows yields a single empty DataFrame.
+    '''
+    if arraysize < 1:
+        raise ValueError(f'arraysize must be a positive integer. Got {arraysize}.')
+    with cnxn.cursor() as cursor:
+        cursor.arraysize = arraysize
+        cursor.execute(query)
+        dtypes = _get_column_dtypes(cursor.description)
+        start = 0
+        while True:
+            rows = cursor.fetchmany(arraysize)
+            if len(rows) == 0 and start > 0:
+                break
+            df = _get_chunk(rows, dtypes)
+            df.index = pd.RangeIndex(start, start + len(df))
+            start += len(df)
+            yield df
+            if len(rows) == 0:
+                break
+
+def quote_identifier(identifier: str) -> str:
+    '''
+    Return the identifier delimited by square brackets, quoting each part of a dotted name such as schema.table.
+    '''
+    return '.'.join('[' + part.replace(']', ']]') + ']' for part in identifier.split('.'))
+
+def _get_nvarchar(length: int) -> str:
+    return f'NVARCHAR({length})' if 0 < length <= _max_nvarchar_length else 'NVARCHAR(MAX)'
+
+def get_sql_type(data_type: dt.DataType) -> str:
+    '''
+    Return the SQL Server type of the column of the data type.
+    '''
+    from custom_package.filety import DataType as dt
+    # Float extends Decimal, so it must be matched first
+    if isinstance(data_type, (dt.Float, dt.Percentage)):
+        return 'FLOAT'
+    if isinstance(data_type, dt.Decimal):
+        return f'DECIMAL({_decimal_precision}, {data_type.decimal_digits})'
+    if isinstance(data_type, dt.Varchar):
+        return _get_nvarchar(data_type.max_length)
+    if isinstance(data_type, dt.Date):
+        return 'DATE'
+    if isinstance(data_type, dt.Categorical):
+        values = list(data_type.value_set) + ([] if pd.isna(data_type.default) else [data_type.default])
+        return _get_nvarchar(max([len(value) for value in values], default=1))
+    raise TypeError(f'{data_type} has no SQL type.')
+
+def _get_parameters(column: pd.Series, data_type: dt.DataType=None) -> List[Any]:
+    '''
+    Return the values of the column as the python objects bound by pyodbc, with None for the missing values.
+    '''
+    if data_type is None:
+        return column.astype(object).where(column.notna(), None).tolist()
+    from custom_package.filety import DataType as dt
+    typed = data_type.set_dtype(column)
+    if isinstance(data_type, dt.Date):
+        return [None if pd.isna(value) else value.date() for value in typed]
+    if isinstance(data_type, dt.Decimal) and not isinstance(data_type, dt.Float):
+        digits = data_type.decimal_digits
+        return [None if pd.isna(value) else decimal.Decimal(f'{value:.{digits}f}') for value in typed]
+    return typed.astype(object).where(typed.notna(), None).tolist()
+
+def _insert(cnxn: pyodbc.Connection, df: pd.DataFrame, target: str, data_types: Dict[str, dt.DataType], chunk_size: int) -> None:
+    '''
+    Insert the rows of the DataFrame in chunks of chunk_size rows, each sent as one parameter array and committed.
+    '''
+    statement = 'INSERT INTO {} ({}) VALUES ({})'.format(quote_identifier(target), ', '.join(quote_identifier(c) for c in df.columns), ', '.join('?' * len(df.columns)))
+    with cnxn.cursor() as cursor:
+        cursor.fast_executemany = True
+        for start in range(0, len(df), chunk_size):
+            chunk = df.iloc[start:start + chunk_size]
+            rows = list(zip(*[_get_parameters(chunk[c], data_types.get(c)) for c in chunk.columns]))
+            cursor.executemany(statement, rows)
+            cnxn.commit()
+
+def _merge(cnxn: pyodbc.Connection, df: pd.DataFrame, target: str, data_types: Dict[str, dt.DataType], NK: List[str], chunk_size: int) -> None:
+    '''
+    Load the DataFrame in a temporary staging table, then merge it into the target on the natural key in a single transaction.
+    '''
+    staging = f'#staging_{uuid.uuid4().hex}'
+    columns = [quote_identifier(c) for c in df.columns]
+    definitions = ', '.join(f'{quote_identifier(c)} {get_sql_type(data_types[c])}' for c in df.columns)
+    on = ' AND '.join(f'target.{quote_identifier(c)} = source.{quote_identifier(c)}' for c in NK)
+    updates = ', '.join(f'target.{quote_identifier(c)} = source.{quote_identifier(c)}' for c in df.columns if c not in NK)
+    statement = f'MERGE INTO {quote_identifier(target)} AS target USING {quote_identifier(staging)} AS source ON {on}'
+    if len(updates) > 0:
+        statement += f' WHEN MATCHED THEN UPDATE SET {updates}'
+    statement += ' WHEN NOT MATCHED THEN INSERT ({}) VALUES ({});'.format(', '.join(columns), ', '.join(f'source.{c}' for c in columns))
+    with cnxn.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {quote_identifier(staging)} ({definitions})')
+        cnxn.commit()
+        try:
+            _insert(cnxn, df, staging, data_types, chunk_size)
+            cursor.execute(statement)
+            cnxn.commit()
+        finally:
+            cursor.execute(f'DROP TABLE {quote_identifier(staging)}')
+            cnxn.commit()
+
+def write_table(cnxn: pyodbc.Connection, data: Union[Table, pd.DataFrame], target: str, data_types: Dict[str, dt.DataType]=None, NK: List[str]=None, merge: bool=False, chunk_size: int=10000) -> int:
+    '''
+    Write the rows of the Table or DataFrame in the target table, whose columns are named as the ones of the DataFrame, and return the number of rows written.
+    The rows are sent in parameter arrays of chunk_size rows (fast_executemany), each chunk being committed on its own. The values are converted according to data_types, which default to the ones of the Table category.
+    With merge, the rows are loaded in a staging table first, then merged into the target on NK (by default the natural key of the Table category): matching rows are updated, the others inserted.
+    '''
+    if chunk_size < 1:
+        raise ValueError(f'chunk_size must be a positive integer. Got {chunk_size}.')
+    # a Table is recognized by its category, so that filety is imported only by its users
+    if hasattr(data, 'get_category'):
+        category = data.get_category()
+        data_types = category.get_data_types() if data_types is None else data_types
+        NK = category.get_NK() if NK is None else NK
+        df = data.get_DataFrame()
+    else:
+        df = data
+    data_types = dict() if data_types is None else data_types
+    try:
+        if merge:
+            missing = [c for c in df.columns if c not in data_types]
+            if len(missing) > 0:
+                raise ValueError(f'The staging table needs the data types of all the columns. Missing: {missing}.')
+            if not NK:
+                raise ValueError('A natural key is needed to merge the rows into the target.')
+            _merge(cnxn, df, target, data_types, NK, chunk_size)
+        else:
+            _insert(cnxn, df, target, data_types, chunk_size)
+    except pyodbc.Error:
+        cnxn.rollback()
+        raise
+    return len(df)
@@ -1,5 +1,8 @@
+from __future__ import annotations
+import io
 import pandas as pd
-from typing import List, Dict, Tuple, Mapping
+import numpy as np
+from typing import List, Dict, Tuple, Mapping, Callable, Iterator
 from pandas._typing import Scalar
 from custom_package import exceptions
 
@@ -10,6 +13,9 @@ def check_multiple_NK(df: pd.DataFrame, NK: List[str]) -> None:
             + '", "'.join(NK)\
             + '". This is not allowed because they are used as the key identifier.'
         raise exceptions.DataException(message)
+    # the duplicated mask is cheaper than the grouping, which only describes the duplicates
+    if not df.duplicated(NK).any():
+        return
     NK_check = df.groupby(NK).size().rename('Count').reset_index(drop=False)
     NK_check.query('Count > 1', inplace=True)
     if len(NK_check) > 0:
@@ -20,6 +26,114 @@ def check_multiple_NK(df: pd.DataFrame, NK: List[str]) -> None:
         raise exceptions.DataException(message)
     return
 
+def hash_NK(df: pd.DataFrame, NK: List[str]) -> np.ndarray:
+    '''
+    Return the 64-bit hash of the natural key of each row. Equal keys of equal dtypes have equal hashes.
+    '''
+    keys = df[NK]
+    floats = keys.select_dtypes(include='floating').columns
+    if len(floats) > 0:
+        # -0.0 and 0.0 are equal keys but hash differently, adding 0.0 turns -0.0 into 0.0
+        keys = keys.copy()
+        keys[floats] = keys[floats] + 0.0
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+class _HashSet:
+    '''
+    Compact set of 64-bit hashes, stored as sorted runs of geometrically growing size,
+    so that adding n hashes costs O(n log N) amortized instead of rebuilding the whole set.
+    '''
+
+    def __init__(self, hashes: np.ndarray = None):
+        self._runs: List[np.ndarray] = []
+        if hashes is not None:
+            self.add(hashes)
+
+    def __len__(self) -> int:
+        return sum([len(run) for run in self._runs])
+
+    def add(self, hashes: np.ndarray) -> None:
+        run = np.unique(np.asarray(hashes, dtype=np.uint64))
+        if len(run) == 0:
+            return
+        while len(self._runs) > 0 and len(self._runs[-1]) <= len(run):
+            run = np.union1d(self._runs.pop(), run)
+        self._runs.append(run)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        '''
+        Return the boolean mask of the given hashes that belong to the set.
+        '''
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        mask = np.zeros(len(hashes), dtype=bool)
+        for run in self._runs:
+            positions = np.minimum(np.searchsorted(run, hashes), len(run) - 1)
+            mask |= run[positions] == hashes
+        return mask
+
+    def to_array(self) -> np.ndarray:
+        return np.concatenate(self._runs) if len(self._runs) > 0 else np.empty(0, dtype=np.uint64)
+
+class NKIndex:
+    '''
+    Index of the hashes of the natural keys already loaded, to check new batches against them without keeping the batches.
+    Hashes depend on the dtypes of the key columns, so the batches must be typed consistently, e.g. by Table.set_data_types.
+    A hash collision, about once in 10^19 pairs of keys, would report a key as already loaded.
+    '''
+
+    def __init__(self, NK: List[str], hashes: np.ndarray = None):
+        self.NK = list(NK)
+        self._hashes = _HashSet(hashes)
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def check(self, df: pd.DataFrame) -> None:
+        '''
+        Check the natural key constraint on df, both within df and against the keys already in the index.
+        '''
+        check_multiple_NK(df=df, NK=self.NK)
+        loaded = self.contains(df)
+        if loaded.any():
+            message = 'The table contains the following tuples "'\
+                + '"/"'.join(self.NK)\
+                + '", which have already been loaded. This is not allowed because they are used as the key identifier.\n'\
+                + ('\t' + df.loc[loaded, self.NK].astype(str).agg('/'.join, axis='columns') + '\n').sum()
+            raise exceptions.DataException(message)
+        return
+
+    def contains(self, df: pd.DataFrame) -> np.ndarray:
+        '''
+        Return the boolean mask of the rows of df whose natural key is already in the index.
+        '''
+        return self._hashes.contains(hash_NK(df, self.NK))
+
+    def add(self, df: pd.DataFrame) -> None:
+        '''
+        Add the natural keys of df to the index, without checking them.
+        '''
+        self._hashes.add(hash_NK(df, self.NK))
+
+    def update(self, df: pd.DataFrame) -> None:
+        '''
+        Check df against the index, then add its natural keys.
+        '''
+        self.check(df)
+        self.add(df)
+
+    def to_bytes(self) -> bytes:
+        '''
+        Serialize the index, to persist it between runs.
+        '''
+        buffer = io.BytesIO()
+        np.savez(buffer, NK=np.array(self.NK, dtype=str), hashes=self._hashes.to_array())
+        return buffer.getvalue()
+
+    @staticmethod
+    def from_bytes(bytes: bytes) -> NKIndex:
+        data = np.load(io.BytesIO(bytes))
+        return NKIndex(NK=data['NK'].tolist(), hashes=data['hashes'])
+
 
 def check_last_row(df: pd.DataFrame) -> pd.DataFrame:
     '''
@@ -30,17 +144,61 @@ def check_last_row(df: pd.DataFrame) -> pd.DataFrame:
         return df.iloc[:-1].copy()
     return df
 
-def split_by_columns(df: pd.DataFrame, columns: List[str]) -> Dict[Tuple[str], pd.DataFrame]:
+def iter_splits(df: pd.DataFrame, columns: List[str]) -> Iterator[Tuple[Tuple[str], pd.DataFrame]]:
     '''
-    split the dataframe into a dictionary tuple-of-column-values -> dataframe
-    according to the values of the specified list of columns
+    Yield the pairs tuple-of-column-values, dataframe of split_by_columns one at a time,
+    grouping by all the columns in a single pass.
     '''
-    res = {(): df}
     for c in columns:
         if c not in df.columns:
             raise KeyError(f'Trying to split a dataframe according to "{c}", which does not match any of its columns.')
-        res = {k + (c + ':' + str(split),): df for k, v in res.items() for split, df in v.groupby(c)}
-    return res
+    if len(columns) == 0:
+        yield (), df
+        return
+    grouped = df.groupby(columns, sort=True, observed=True)
+    # rows without group (blank values) get -1 and are sorted first, rows of each group keep their order
+    codes = grouped.ngroup().to_numpy()
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(grouped.ngroups + 1))
+    for i, key in enumerate(grouped.size().index):
+        key = key if isinstance(key, tuple) else (key,)
+        yield tuple([c + ':' + str(split) for c, split in zip(columns, key)]), df.take(order[bounds[i]:bounds[i+1]])
+
+def split_by_columns(df: pd.DataFrame, columns: List[str]) -> Dict[Tuple[str], pd.DataFrame]:
+    '''
+    split the dataframe into a dictionary tuple-of-column-values -> dataframe
+    according to the values of the specified list of columns
+    '''
+    return dict(iter_splits(df, columns))
+
+file_formats = {'csv', 'parquet', 'feather'}
+
+def get_bytes(df: pd.DataFrame, format: str='csv') -> bytes:
+    '''
+    Serialize the dataframe, without its index, as csv (blank values as NULL), parquet or feather (Arrow IPC).
+    Parquet and feather keep the dtypes and require pyarrow.
+    '''
+    if format == 'csv':
+        return df.to_csv(na_rep='NULL', index=False).encode()
+    elif format == 'parquet':
+        return df.to_parquet(index=False)
+    elif format == 'feather':
+        buffer = io.BytesIO()
+        df.reset_index(drop=True).to_feather(buffer)
+        return buffer.getvalue()
+    raise ValueError(f'"{format}" is not a known file format, specify one among {file_formats}.')
+
+def read_bytes(bytes: bytes, format: str='csv') -> pd.DataFrame:
+    '''
+    Read a dataframe serialized by get_bytes. csv values are read as strings.
+    '''
+    if format == 'csv':
+        return pd.read_csv(io.BytesIO(bytes), na_values='NULL', dtype=str)
+    elif format == 'parquet':
+        return pd.read_parquet(io.BytesIO(bytes))
+    elif format == 'feather':
+        return pd.read_feather(io.BytesIO(bytes))
+    raise ValueError(f'"{format}" is not a known file format, specify one among {file_formats}.')
 
 def apply_elementwise_to_columns(df: pd.DataFrame, functions: Dict[str, Mapping[Scalar, Scalar]])-> pd.DataFrame:
     missing_columns = set(functions.keys()).difference(df.columns)
@@ -50,4 +208,17 @@ def apply_elementwise_to_columns(df: pd.DataFrame, functions: Dict[str, Mapping[
     res = pd.DataFrame()
     for column, function in functions.items():
         res[column] = df[column].map(function)
-    return res
\ No newline at end of file
+    return res
+
+def apply_to_columns(df: pd.DataFrame, functions: Dict[str, Callable[[pd.Series], pd.Series]])-> pd.DataFrame:
+    '''
+    Apply each function to the whole column it is keyed by, and return the DataFrame of the results.
+    '''
+    missing_columns = set(functions.keys()).difference(df.columns)
+    if len(missing_columns)>0:
+        msg = 'The following columns specifed as keys in the function dictionary could not be found in the DataFrame: "{}".'.format('", "'.join(missing_columns))
+        raise Exception(msg)
+    res = pd.DataFrame(index=df.index)
+    for column, function in functions.items():
+        res[column] = function(df[column])
+    return res
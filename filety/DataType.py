@@ -1,6 +1,6 @@
 from __future__ import annotations
 import datetime
-from typing import Any, Set, Callable
+from typing import Any, Set, Callable, Tuple
 import re
 import pandas as pd
 import numpy as np
@@ -8,6 +8,56 @@ from pandas._typing import Dtype, Scalar
 from abc import ABC, abstractmethod
 
 
+def _map_distinct(column: pd.Series, function: Callable[[Scalar], Scalar])-> pd.Series:
+    '''
+    Apply the function once per distinct value of a column of strings, and to each missing value.
+    Columns holding other types are mapped element by element, since distinct values of different types may compare equal.
+    '''
+    if pd.api.types.infer_dtype(column, skipna=True) != 'string':
+        return column.map(function)
+    codes, uniques = pd.factorize(column)
+    result = np.empty(len(uniques), dtype=object)
+    result[:] = [function(value) for value in uniques]
+    result = pd.Series(result[codes], index=column.index, dtype=object)
+    missing = codes == -1
+    if missing.any():
+        result[missing] = column[missing].map(function)
+    return result
+
+def _split_pairs(pairs: pd.Series)-> Tuple[pd.Series, pd.Series]:
+    '''
+    Split a column of (converted value, consistency) pairs into the converted column and the consistency mask.
+    '''
+    converted = pd.Series([pair[0] for pair in pairs], index=pairs.index, dtype=object)
+    consistent = pd.Series([pair[1] for pair in pairs], index=pairs.index, dtype=bool)
+    return converted, consistent
+
+def _parse_float(strings: pd.Series)-> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Parse the strings as float would, returning the parsed values (nan where parsing fails) and the mask of the parsed ones.
+    '''
+    values = strings.to_numpy(dtype=object)
+    try:
+        # NumPy casts strings to float through float itself
+        return values.astype(np.float64), np.ones(len(values), dtype=bool)
+    except (ValueError, TypeError):
+        pass
+    numbers = np.full(len(values), np.nan)
+    parsed = np.zeros(len(values), dtype=bool)
+    for i, value in enumerate(values):
+        try:
+            numbers[i] = float(value)
+            parsed[i] = True
+        except (ValueError, TypeError):
+            pass
+    return numbers, parsed
+
+def _round(numbers: np.ndarray, digits: int)-> np.ndarray:
+    '''
+    Round as the built-in round does on Python floats, which differs from numpy.round on some halfway cases.
+    '''
+    return np.array([round(x, digits) for x in numbers.tolist()], dtype=np.float64)
+
 
 class DataType(ABC):
 
@@ -47,17 +97,43 @@ class DataType(ABC):
     def _check_constraint(self, str)-> bool:
         pass
 
-    def is_consistent(self, value: Scalar)-> bool:
+    def _parse(self, value: Scalar)-> Tuple[Scalar, bool]:
+        '''
+        Return the converted value, or na if the value cannot be converted, and whether the value is consistent.
+        '''
         try:
             value = self.convert(value)
         except (ValueError, TypeError):
-            return False
+            return self.na, False
         if (value is self.na) or (pd.notna(self.na) and pd.notna(value) and value == self.na):
-            return True
+            return value, True
         elif not isinstance(value, str):
-            return False
+            return value, False
         else:
-            return self._check_constraint(value)
+            return value, self._check_constraint(value)
+
+    def is_consistent(self, value: Scalar)-> bool:
+        return self._parse(value)[1]
+
+    def parse_series(self, column: pd.Series)-> Tuple[pd.Series, pd.Series]:
+        '''
+        Convert a whole column and check its consistency in a single pass.
+        Return the converted column, holding na where a value cannot be converted, and the boolean mask of the consistent values.
+        The converted column matches the elementwise convert once set_dtype is applied.
+        '''
+        return _split_pairs(column.map(self._parse))
+
+    def convert_series(self, column: pd.Series)-> pd.Series:
+        '''
+        Convert a whole column, see parse_series.
+        '''
+        return self.parse_series(column)[0]
+
+    def is_consistent_series(self, column: pd.Series)-> pd.Series:
+        '''
+        Return the boolean mask of the consistent values of a whole column.
+        '''
+        return self.parse_series(column)[1]
 
     def validate(self, value: Scalar)-> None:
         if not self.is_consistent(value):
@@ -68,6 +144,12 @@ class DataType(ABC):
     def remediate(self, value: Scalar)-> Scalar:
         pass
 
+    def remediate_series(self, column: pd.Series)-> pd.Series:
+        '''
+        Remediate a whole column.
+        '''
+        return column.map(self.remediate)
+
     @property
     @abstractmethod
     def remediation_description(self)-> str:
@@ -83,6 +165,10 @@ class Varchar(DataType):
         self._max_length = max_length
         self.unspaced = unspaced
 
+    @property
+    def max_length(self)-> int:
+        return self._max_length
+
     def __str__(self)-> str:
         name = f'varchar[{self._max_length}]'
         if self.unspaced:
@@ -105,6 +191,14 @@ class Varchar(DataType):
     
     def _check_constraint(self, value: str) -> bool:
         return len(value) <= self._max_length
+
+    def parse_series(self, column: pd.Series) -> Tuple[pd.Series, pd.Series]:
+        missing = column.isna()
+        converted = pd.Series(self.na, index=column.index, dtype=object)
+        converted[~missing] = column[~missing].astype(str).str.rstrip()
+        consistent = missing.copy()
+        consistent[~missing] = converted[~missing].str.len() <= self._max_length
+        return converted, consistent.astype(bool)
     
     def remediate(self, value: Scalar) -> Scalar:
         if pd.isna(value):
@@ -117,6 +211,10 @@ class Varchar(DataType):
         if self.unspaced:
             value = value.replace(' ', '')
         return value[:min(len(value), self._max_length)]
+
+    def remediate_series(self, column: pd.Series) -> pd.Series:
+        # the string methods of the pyarrow-backed dtype match \s on ASCII whitespace only, unlike re
+        return _map_distinct(column, self.remediate)
     
     @property
     def remediation_description(self) -> str:
@@ -137,6 +235,10 @@ class Decimal(DataType):
         self._comma_separated = comma_separated
         self._decimal_digits = decimal_digits
 
+    @property
+    def decimal_digits(self)-> int:
+        return self._decimal_digits
+
     def __str__(self)-> str:
         string = f'decimal[{self._decimal_digits}]'
         if self._comma_separated:
@@ -164,9 +266,36 @@ class Decimal(DataType):
             return string.replace(',', '')
         else:
             return string.replace('.', '').replace(',', '.')
+
+    def _format_series(self, strings: pd.Series)-> pd.Series:
+        if not self._comma_separated:
+            return strings.str.replace(',', '', regex=False)
+        else:
+            return strings.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+
+    def _parse_numbers(self, column: pd.Series)-> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        '''
+        Return the rounded values of the column, the mask of its missing values and the mask of the values parsed as numbers.
+        '''
+        missing = column.isna().to_numpy()
+        numbers, parsed = _parse_float(self._format_series(column[~missing].astype(str)))
+        values = np.full(len(column), np.nan)
+        values[~missing] = _round(numbers, self._decimal_digits)
+        is_number = np.zeros(len(column), dtype=bool)
+        is_number[~missing] = parsed
+        return values, missing, is_number
     
     def _check_constraint(self, value: str) -> bool:
         return value.rstrip('0')[::-1].find('.') <= self._decimal_digits
+
+    def parse_series(self, column: pd.Series) -> Tuple[pd.Series, pd.Series]:
+        # a number rounded to the decimal digits meets the constraint unless its representation has an exponent, as for magnitudes from 1e16 or below 1e-4
+        values, missing, is_number = self._parse_numbers(column)
+        consistent = missing | is_number
+        magnitudes = np.abs(values)
+        exponent = is_number & ((magnitudes >= 1e16) | ((magnitudes > 0) & (magnitudes < 1e-4)))
+        consistent[exponent] = [self._check_constraint(str(value)) for value in values[exponent].tolist()]
+        return pd.Series(values, index=column.index, dtype=self.dtype), pd.Series(consistent, index=column.index)
     
     def remediate(self, value: Scalar) -> Scalar:
         if pd.isna(value):
@@ -181,6 +310,15 @@ class Decimal(DataType):
         if self._comma_separated:
             value = value.replace('.', ',')
         return value
+
+    def remediate_series(self, column: pd.Series) -> pd.Series:
+        values, _, is_number = self._parse_numbers(column)
+        strings = [str(value) for value in values[is_number].tolist()]
+        if self._comma_separated:
+            strings = [string.replace('.', ',') for string in strings]
+        result = pd.Series(self.na, index=column.index, dtype=object)
+        result[is_number] = strings
+        return result
     
     @property
     def remediation_description(self) -> str:
@@ -223,6 +361,10 @@ class Date(DataType):
     
     def _check_constraint(self, value: str) -> bool:
         return True
+
+    def parse_series(self, column: pd.Series) -> Tuple[pd.Series, pd.Series]:
+        # dates repeat a lot, and strptime is stricter than pd.to_datetime (e.g. on years out of the Timestamp bounds)
+        return _split_pairs(_map_distinct(column, self._parse))
     
     def remediate(self, value: Scalar) -> Scalar:
         if pd.isna(value):
@@ -236,6 +378,9 @@ class Date(DataType):
         except:
             return self.na
         return value
+
+    def remediate_series(self, column: pd.Series) -> pd.Series:
+        return _map_distinct(column, self.remediate)
     
     @property
     def remediation_description(self) -> str:
@@ -274,6 +419,9 @@ class Categorical(DataType):
     def _check_constraint(self, value: str)-> bool:
         return value in self.value_set
 
+    def parse_series(self, column: pd.Series)-> Tuple[pd.Series, pd.Series]:
+        return _split_pairs(_map_distinct(column, self._parse))
+
     def remediate(self, value: Scalar)-> Scalar:
         if value is self.na or pd.isna(value):
             return self.na
@@ -283,6 +431,9 @@ class Categorical(DataType):
             value = self.default
         return value
 
+    def remediate_series(self, column: pd.Series)-> pd.Series:
+        return _map_distinct(column, self.remediate)
+
     @property
     def remediation_description(self)-> str:
         return f'will be cleaned from leading and trailing spaces. If not category matches, the default "{self.default}" will be used.'
@@ -319,6 +470,26 @@ class Percentage(DataType):
         value = float(value)
         return value >= 0 and value <= 1
 
+    def _parse_numbers(self, column: pd.Series)-> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        '''
+        Return the converted values of the column, the mask of its missing values and the mask of the values parsed as numbers.
+        '''
+        missing = column.isna().to_numpy()
+        numbers, parsed = _parse_float(column[~missing].astype(str))
+        if self.hundreds:
+            numbers = numbers / 100
+        values = np.full(len(column), np.nan)
+        values[~missing] = _round(numbers, 10)
+        is_number = np.zeros(len(column), dtype=bool)
+        is_number[~missing] = parsed
+        return values, missing, is_number
+
+    def parse_series(self, column: pd.Series)-> Tuple[pd.Series, pd.Series]:
+        values, missing, is_number = self._parse_numbers(column)
+        with np.errstate(invalid='ignore'):
+            in_range = (values >= 0) & (values <= 1)
+        return pd.Series(values, index=column.index, dtype=self.dtype), pd.Series(missing | (is_number & in_range), index=column.index)
+
     def remediate(self, value: Scalar)-> Scalar:
         if value < 0:
             value = 0
@@ -1,16 +1,25 @@
 from __future__ import annotations
 from custom_package import exceptions, dataframe_utils as df_utils, azure_function_utils as f_utils
 import pandas as pd
-import io
+import time
 from collections import UserString
-from typing import Callable, Set, List, Dict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Set, List, Dict, Tuple, Union, NamedTuple, Optional, BinaryIO
 from custom_package.filety.categories import file_categories_map
 from custom_package.filety import DataType as dt
 
 file_categories_set = set(file_categories_map.keys())
+copy_modes = {'deep', 'cow'}
 
-def _data_types_check_step(df: pd.DataFrame, data_types: Dict[str, dt.DataType], remediate: bool)-> bool:
-    not_consistent_df = ~df_utils.apply_elementwise_to_columns(df, {c: d.is_consistent for (c, d) in data_types.items()})
+def _copy_on_write_enabled()-> bool:
+    '''
+    Return whether pandas Copy-on-Write is active, as it always is from pandas 3.0.
+    '''
+    if int(pd.__version__.split('.')[0]) >= 3:
+        return True
+    return pd.get_option('mode.copy_on_write') is True
+
+def _data_types_check_step(df: pd.DataFrame, not_consistent_df: pd.DataFrame, data_types: Dict[str, dt.DataType], remediate: bool)-> bool:
     not_consistent_columns = not_consistent_df.columns[not_consistent_df.any(axis='index')].tolist()
     consistency = (len(not_consistent_columns)==0)
     if not consistency:
@@ -35,6 +44,7 @@ class FileCategory(UserString):
         self._columns = file_categories_map[value]['columns']
         self._natural_key = file_categories_map[value]['natural_key']
         self._reading_function = file_categories_map[value]['reading_function']
+        self._reads_stream = file_categories_map[value].get('reads_stream', False)
 
     def __add__(self, suffix: str) -> str:
         '''
@@ -42,8 +52,14 @@ class FileCategory(UserString):
         '''
         return str(self) + suffix
     
-    def get_reading_function(self) -> Callable[[bytes], pd.DataFrame]:
+    def get_reading_function(self) -> Callable[[Union[bytes, BinaryIO]], pd.DataFrame]:
         return self._reading_function
+
+    def reads_stream(self) -> bool:
+        '''
+        Return whether the reading function accepts a binary file-like object besides bytes.
+        '''
+        return self._reads_stream
     
     def get_transformation(self) -> Callable[[pd.DataFrame], pd.DataFrame]:
         return self._transformation
@@ -68,10 +84,19 @@ class FileCategory(UserString):
 
 class Table:
 
-    def __init__(self, name: str, category: str, df: pd.DataFrame):
+    def __init__(self, name: str, category: str, df: pd.DataFrame, copy_mode: str='deep'):
+        '''
+        With copy_mode 'deep', get_DataFrame returns a deep copy of the data.
+        With copy_mode 'cow', it returns a shallow copy that pandas Copy-on-Write duplicates only where it gets modified.
+        '''
+        if copy_mode not in copy_modes:
+            raise ValueError(f'"{copy_mode}" is not a known copy mode, specify one among {copy_modes}.')
+        if copy_mode == 'cow' and not _copy_on_write_enabled():
+            raise ValueError('The copy mode "cow" requires pandas Copy-on-Write: set pd.options.mode.copy_on_write = True.')
         self._category = FileCategory(category)
         self._df = df
         self._name = name
+        self._copy_mode = copy_mode
     
     def set_DataFrame(self, df: pd.DataFrame)-> None:
         self._df = df
@@ -83,7 +108,10 @@ class Table:
         self._name = name
 
     def get_DataFrame(self)-> pd.DataFrame:
-        return self._df.copy()
+        return self._df.copy(deep=self._copy_mode == 'deep')
+
+    def get_copy_mode(self)-> str:
+        return self._copy_mode
     
     def get_category(self)-> FileCategory:
         return self._category
@@ -98,41 +126,95 @@ class Table:
         '''
         return csv bytes of the Table
         '''
-        df = self.get_DataFrame()
-        return df.to_csv(na_rep='NULL', index=False).encode()
+        return df_utils.get_bytes(self._df, format='csv')
+
+    def _get_typed_DataFrame(self)-> pd.DataFrame:
+        '''
+        return the DataFrame with the columns specified by the category set to the dtypes of their data types
+        '''
+        data_types = self.get_category().get_data_types()
+        return pd.DataFrame({c: data_types[c].set_dtype(self._df[c]) if c in data_types else self._df[c] for c in self._df.columns}, index=self._df.index)
+
+    def get_bytes(self, format: str='csv')-> bytes:
+        '''
+        return the bytes of the Table in the given format among csv, parquet and feather.
+        parquet and feather store the dtypes of the category data types, so that the Table can be read back without typing it again.
+        '''
+        if format == 'csv':
+            return self.get_csv_bytes()
+        return df_utils.get_bytes(self._get_typed_DataFrame(), format=format)
+
+    def get_parquet_bytes(self)-> bytes:
+        return self.get_bytes(format='parquet')
     
     @staticmethod
-    def read(name: str, bytes: bytes, category: str)-> Table:
+    def read(name: str, bytes: Union[bytes, BinaryIO], category: str, copy_mode: str='deep')-> Table:
         '''
         return an instance of a Table from the bytes, according to the reading function og the category
+        bytes can also be a binary stream: it is passed as it is if the category reads streams, otherwise it is read whole first.
         '''
-        df = FileCategory(category).get_reading_function()(bytes)
-        return Table(name=name, category=category, df=df)
+        file_category = FileCategory(category)
+        if hasattr(bytes, 'read') and not file_category.reads_stream():
+            bytes = bytes.read()
+        df = file_category.get_reading_function()(bytes)
+        return Table(name=name, category=category, df=df, copy_mode=copy_mode)
     
     @staticmethod
-    def get_empty_table(category: str)-> Table:
+    def get_empty_table(category: str, copy_mode: str='deep')-> Table:
         '''
         return an instance of a Table with empty DataFrame
         '''
         df = pd.DataFrame([], columns=list(FileCategory(category).get_required_columns()))
-        return Table(name=f'empty-{category}', category=category, df=df)
+        return Table(name=f'empty-{category}', category=category, df=df, copy_mode=copy_mode)
     
     @staticmethod
-    def from_csv_bytes(name: str, category: str, bytes: bytes)-> Table:
-        df = pd.read_csv(io.BytesIO(bytes), na_values='NULL', dtype=str)
-        return Table(name=name, category=category, df=df)
+    def from_csv_bytes(name: str, category: str, bytes: bytes, copy_mode: str='deep')-> Table:
+        df = df_utils.read_bytes(bytes, format='csv')
+        return Table(name=name, category=category, df=df, copy_mode=copy_mode)
+
+    @staticmethod
+    def from_bytes(name: str, category: str, bytes: bytes, format: str='csv', copy_mode: str='deep')-> Table:
+        '''
+        return an instance of a Table from the bytes returned by get_bytes in the same format.
+        parquet and feather columns are set to the dtypes of the category data types, without validating their values again.
+        '''
+        if format == 'csv':
+            return Table.from_csv_bytes(name=name, category=category, bytes=bytes, copy_mode=copy_mode)
+        table = Table(name=name, category=category, df=df_utils.read_bytes(bytes, format=format), copy_mode=copy_mode)
+        table.set_DataFrame(table._get_typed_DataFrame())
+        return table
+
+    @staticmethod
+    def from_parquet_bytes(name: str, category: str, bytes: bytes, copy_mode: str='deep')-> Table:
+        return Table.from_bytes(name=name, category=category, bytes=bytes, format='parquet', copy_mode=copy_mode)
     
     def set_data_types(self, remediate: bool)-> None:
-        df = self.get_DataFrame()
+        '''
+        Convert the columns to the data types of the category, parsing each column once.
+        If remediate, the values that are not consistent are remediated and parsed again, the others are left untouched.
+        '''
+        df = self._df
         data_types = self.get_category().get_data_types()
-        consistency = _data_types_check_step(df=df, data_types=data_types, remediate=remediate)
+        converted, consistent = dict(), dict()
+        for c, d in data_types.items():
+            converted[c], consistent[c] = d.parse_series(df[c])
+        converted_df = pd.DataFrame(converted, index=df.index)
+        not_consistent_df = ~pd.DataFrame(consistent, index=df.index)
+        consistency = _data_types_check_step(df=df, not_consistent_df=not_consistent_df, data_types=data_types, remediate=remediate)
         if remediate and not consistency:
-            df = df_utils.apply_elementwise_to_columns(df, {c: d.remediate for (c, d) in data_types.items()}).copy()
-            consistency = _data_types_check_step(df=df, data_types=data_types, remediate=False)
+            remediated_df = df[list(data_types.keys())].copy()
+            for c in not_consistent_df.columns[not_consistent_df.any(axis='index')]:
+                mask = not_consistent_df[c]
+                remediated_df[c] = remediated_df[c].astype(object)
+                remediated_df.loc[mask, c] = data_types[c].remediate_series(df.loc[mask, c])
+                converted, consistent = data_types[c].parse_series(remediated_df.loc[mask, c])
+                converted_df[c] = converted_df[c].astype(object)
+                converted_df.loc[mask, c] = converted
+                not_consistent_df.loc[mask, c] = ~consistent
+            consistency = _data_types_check_step(df=remediated_df, not_consistent_df=not_consistent_df, data_types=data_types, remediate=False)
         if not consistency:
             raise exceptions.DataException('Unable to set the correct data types.')
-        df = df_utils.apply_elementwise_to_columns(df, {c: d.convert for (c, d) in data_types.items()}).copy()
-        converted_df = df.apply({c: d.set_dtype for (c, d) in data_types.items()}, axis=0).copy()
+        converted_df = df_utils.apply_to_columns(converted_df, {c: d.set_dtype for (c, d) in data_types.items()})
         self.set_DataFrame(converted_df)
         return
     
@@ -168,7 +250,7 @@ class Table:
         '''
         Select only the specified columns from the table.
         '''
-        df = self.get_DataFrame()
+        df = self._df
         missing_columns = columns.difference(df.columns)
         if len(missing_columns) > 0:
             raise exceptions.MissingColumnsException(file_name=self.get_name(), missing_columns=missing_columns)
@@ -188,7 +270,7 @@ class Table:
         '''
         Check the natural key constraint on the table
         '''
-        df = self.get_DataFrame()
+        df = self._df
         NK = self.get_category().get_NK()
         if len(NK) == 0:
             return
@@ -198,17 +280,23 @@ class Table:
             self.raise_error(e)
         return
     
-    def process(self, remediate: bool)-> None:
+    def process(self, remediate: bool, timings: Dict[str, float]=None)-> None:
         '''
         Perform all required ops on the table to prepare it
+        If a timings dictionary is given, the seconds spent on each step are stored in it.
         '''
+        steps = {'select_required_columns': self.select_required_columns,
+            'set_data_types': lambda: self.set_data_types(remediate=remediate),
+            'pre_check': self.pre_check,
+            'transform': self.transform,
+            'check_NK': self.check_NK,
+            'post_check': self.post_check}
+        timings = dict() if timings is None else timings
         try:
-            self.select_required_columns()
-            self.set_data_types(remediate=remediate)
-            self.pre_check()
-            self.transform()
-            self.check_NK()
-            self.post_check()
+            for step_name, step in steps.items():
+                start = time.perf_counter()
+                step()
+                timings[step_name] = time.perf_counter() - start
         except exceptions.DataException as e:
             message = f'I controlli sul file "{self.get_name()}" hanno prodotto il seguente errore.\n'\
                 + e.message
@@ -222,7 +310,7 @@ class Table:
         name = name if name is not None else self.get_name()
         df = self.get_DataFrame()
         category = self.get_category()
-        return Table(name=name, category=category, df=df)
+        return Table(name=name, category=category, df=df, copy_mode=self.get_copy_mode())
     
     def __add__(self, other: Table)-> Table:
         '''
@@ -232,9 +320,9 @@ class Table:
         other_category = other.get_category()
         if self_category != other_category:
             raise Exception(f'Trying to add two tables with different categories: {self_category}, {other_category}.')
-        self_df = self.get_DataFrame()
+        self_df = self._df
         self_name = self.get_name()
-        other_df = other.get_DataFrame()
+        other_df = other._df
         other_name = other.get_name()
 
         df = pd.concat([self_df, other_df], axis='index')
@@ -244,4 +332,103 @@ class Table:
             message = f'The two tables "{self_name}" and "{other_name}" share some rows. This is likely to mean that duplicates would have been uploaded.'
             raise exceptions.DataException(message)
         
-        return Table(name = self_name + '+' + other_name, category=self_category, df=df)
\ No newline at end of file
+        return Table(name = self_name + '+' + other_name, category=self_category, df=df, copy_mode=self.get_copy_mode())
+
+class TableAccumulator:
+    '''
+    Accumulate tables of the same category and columns, concatenating their DataFrames only once, in get_table.
+    As Table.__add__ does, each new table is checked for rows shared with the ones already accumulated,
+    but through an index of row hashes, in a time proportional to the new table only.
+    If check_NK, the natural key constraint of the category is checked across all the tables as well.
+    The tables must have consistent dtypes, e.g. after Table.set_data_types, since the hashes depend on them.
+    '''
+
+    def __init__(self, category: str, check_NK: bool=False, copy_mode: str='deep'):
+        self._category = FileCategory(category)
+        self._check_NK = check_NK and len(self._category.get_NK()) > 0
+        self._copy_mode = copy_mode
+        self._frames: List[pd.DataFrame] = []
+        self._names: List[str] = []
+        self._columns: List[str] = None
+        self._row_index: df_utils.NKIndex = None
+        self._NK_index = df_utils.NKIndex(self._category.get_NK())
+
+    def __len__(self)-> int:
+        return sum([len(df) for df in self._frames])
+
+    def extend(self, table: Table)-> None:
+        '''
+        Check the table against the accumulated ones and append it.
+        '''
+        category = table.get_category()
+        if category != self._category:
+            raise Exception(f'Trying to add two tables with different categories: {self._category}, {category}.')
+        df = table.get_DataFrame()
+        name = table.get_name()
+        if self._columns is None:
+            self._columns = df.columns.tolist()
+            self._row_index = df_utils.NKIndex(self._columns)
+        elif set(df.columns) != set(self._columns):
+            raise Exception(f'The table "{name}" does not have the same columns as the accumulated ones: "' + '", "'.join(self._columns) + '".')
+        df = df[self._columns]
+        if self._row_index.contains(df).any():
+            message = f'The table "{name}" shares some rows with the tables "' + '", "'.join(self._names) + '". This is likely to mean that duplicates would have been uploaded.'
+            raise exceptions.DataException(message)
+        if self._check_NK:
+            try:
+                self._NK_index.update(df)
+            except exceptions.DataException as e:
+                table.raise_error(e)
+        self._row_index.add(df)
+        self._frames.append(df)
+        self._names.append(name)
+        return
+
+    def get_table(self, name: str=None)-> Table:
+        '''
+        Return the Table of all the rows accumulated, named after the accumulated tables if no name is given.
+        '''
+        if len(self._frames) == 0:
+            return Table.get_empty_table(str(self._category), copy_mode=self._copy_mode)
+        name = name if name is not None else '+'.join(self._names)
+        df = pd.concat(self._frames, axis='index')
+        return Table(name=name, category=self._category, df=df, copy_mode=self._copy_mode)
+
+class ProcessResult(NamedTuple):
+    '''
+    Outcome of the processing of a table in a batch: the processed table, or the DataException raised, and the seconds spent on each step.
+    '''
+    name: str
+    table: Optional[Table]
+    exception: Optional[exceptions.DataException]
+    timings: Dict[str, float]
+
+def _process_table(table: Union[Table, Tuple[str, bytes, str]], remediate: bool)-> ProcessResult:
+    timings = dict()
+    start = time.perf_counter()
+    name = table.get_name() if isinstance(table, Table) else table[0]
+    try:
+        if not isinstance(table, Table):
+            name, bytes, category = table
+            table = Table.read(name=name, bytes=bytes, category=category)
+            timings['read'] = time.perf_counter() - start
+        table.process(remediate=remediate, timings=timings)
+        result = ProcessResult(name=name, table=table, exception=None, timings=timings)
+    except exceptions.DataException as e:
+        result = ProcessResult(name=name, table=None, exception=e, timings=timings)
+    timings['total'] = time.perf_counter() - start
+    return result
+
+def process_tables(tables: List[Union[Table, Tuple[str, bytes, str]]], remediate: bool, max_workers: int=None, executor: str='thread')-> List[ProcessResult]:
+    '''
+    Read (when given as tuples name, bytes, category) and process independent tables in parallel, returning their results in the same order.
+    A DataException raised by a table is collected in its result instead of stopping the batch; any other exception is raised.
+    With executor 'process' the tables are processed in a pool of processes: the categories must be picklable (no lambdas)
+    and the messages logged by the workers do not reach the logger of the calling process. Use 'thread' otherwise.
+    '''
+    executors = {'thread': ThreadPoolExecutor, 'process': ProcessPoolExecutor}
+    if executor not in executors:
+        raise ValueError(f'"{executor}" is not a known executor, specify one among {set(executors.keys())}.')
+    with executors[executor](max_workers=max_workers) as pool:
+        futures = [pool.submit(_process_table, table, remediate) for table in tables]
+        return [future.result() for future in futures]
@@ -1 +1 @@
-from custom_package.filety.Table import Table, FileCategory
\ No newline at end of file
+from custom_package.filety.Table import Table, FileCategory, TableAccumulator, ProcessResult, process_tables
\ No newline at end of file
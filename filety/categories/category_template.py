@@ -32,7 +32,7 @@ def _post_check(df: pd.DataFrame)-> None:
 
 def _read(bytes: bytes) -> pd.DataFrame:
     '''
-    Read given bytes
+    Read given bytes, or a binary file-like object if "reads_stream" is True
     '''
     return pd.DataFrame({})
 
@@ -41,4 +41,5 @@ map = {'reading_function': _read,
     'transformation': _transform,
     'pre_check_function':_pre_check,
     'post_check_function':_post_check,
-    'natural_key':_NK}
\ No newline at end of file
+    'natural_key':_NK,
+    'reads_stream': False}
\ No newline at end of file
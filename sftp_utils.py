@@ -1,16 +1,162 @@
+from __future__ import annotations
 import paramiko
+import io
+import json
 import datetime
-from typing import Dict
+import os
+import posixpath
+import shutil
+import stat
+import threading
+from contextlib import contextmanager
+from queue import Queue
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, Tuple, List, Union, Callable, BinaryIO, ContextManager
 from pytz import timezone
 import logging
 
-def connect(host: str, username: str, password: str)-> paramiko.SFTPClient:
-    transport = paramiko.Transport((host, 22))
+# flow control of the channels opened by fetch_files: a window of 32 MiB keeps a high-latency link busy
+fetch_window_size = 2**25
+fetch_max_packet_size = 2**15
+
+def connect(host: str, username: str, password: str, window_size: int=paramiko.common.DEFAULT_WINDOW_SIZE, max_packet_size: int=paramiko.common.DEFAULT_MAX_PACKET_SIZE)-> paramiko.SFTPClient:
+    '''
+    window_size and max_packet_size are the defaults of the channels opened on the transport.
+    '''
+    transport = paramiko.Transport((host, 22), default_window_size=window_size, default_max_packet_size=max_packet_size)
     transport.connect(username=username, password=password)
     return paramiko.SFTPClient.from_transport(transport)
 
-def read_file(sftp: paramiko.SFTPClient, path: str)-> bytes:
+class SFTPPool:
+    '''
+    Pool of SFTP sessions keyed by (host, username), sharing one authenticated transport per key instead of a handshake per connection.
+    Transports send keepalives, idle sessions are checked with a round trip before reuse, and a stale transport is replaced by a new connection.
+    At most max_sessions sessions per key are in use at a time; session() waits for one to be released.
+    '''
+    def __init__(self, max_sessions: int=4, keepalive: int=30, window_size: int=paramiko.common.DEFAULT_WINDOW_SIZE, max_packet_size: int=paramiko.common.DEFAULT_MAX_PACKET_SIZE) -> None:
+        if max_sessions < 1:
+            raise ValueError(f'max_sessions must be a positive integer. Got {max_sessions}.')
+        self.max_sessions = max_sessions
+        self.keepalive = keepalive
+        self.window_size = window_size
+        self.max_packet_size = max_packet_size
+        # _lock guards the dictionaries only, network round trips happen outside it
+        self._lock = threading.Lock()
+        self._connecting: Dict[Tuple[str, str], threading.Lock] = dict()
+        self._transports: Dict[Tuple[str, str], paramiko.Transport] = dict()
+        self._idle: Dict[Tuple[str, str], List[paramiko.SFTPClient]] = dict()
+        self._semaphores: Dict[Tuple[str, str], threading.BoundedSemaphore] = dict()
+
+    @staticmethod
+    def _is_healthy(sftp: paramiko.SFTPClient) -> bool:
+        try:
+            sftp.normalize('.')
+            return True
+        except (OSError, EOFError, paramiko.SSHException):
+            return False
+
+    def _open(self, key: Tuple[str, str], password: str) -> paramiko.SFTPClient:
+        '''
+        Return an idle session that answers, or a new one on the transport of the key, connecting again if the transport is not active.
+        '''
+        while True:
+            with self._lock:
+                idle = self._idle.get(key, [])
+                sftp = idle.pop() if len(idle) > 0 else None
+            if sftp is None:
+                break
+            if sftp.get_channel().get_transport().is_active() and SFTPPool._is_healthy(sftp):
+                return sftp
+            sftp.close()
+        with self._lock:
+            connecting = self._connecting.setdefault(key, threading.Lock())
+        # only the sessions of the same key wait for the handshake
+        with connecting:
+            with self._lock:
+                transport = self._transports.get(key)
+            if transport is not None and transport.is_active():
+                try:
+                    return paramiko.SFTPClient.from_transport(transport)
+                except paramiko.SSHException:
+                    # the transport looked active but could not open a channel, so connect again
+                    pass
+            if transport is not None:
+                transport.close()
+            sftp = connect(key[0], key[1], password, window_size=self.window_size, max_packet_size=self.max_packet_size)
+            transport = sftp.get_channel().get_transport()
+            transport.set_keepalive(self.keepalive)
+            with self._lock:
+                self._transports[key] = transport
+                stale = self._idle.pop(key, [])
+            for idle_sftp in stale:
+                idle_sftp.close()
+            return sftp
+
+    @contextmanager
+    def session(self, host: str, username: str, password: str) -> Iterator[paramiko.SFTPClient]:
+        '''
+        Yield an SFTP session for (host, username), returned to the pool on exit. A session that raised a connection error is discarded.
+        '''
+        key = (host, username)
+        with self._lock:
+            semaphore = self._semaphores.setdefault(key, threading.BoundedSemaphore(self.max_sessions))
+        with semaphore:
+            sftp = self._open(key, password)
+            healthy = True
+            try:
+                yield sftp
+            except (EOFError, paramiko.SSHException):
+                healthy = False
+                raise
+            finally:
+                if healthy:
+                    with self._lock:
+                        self._idle.setdefault(key, []).append(sftp)
+                else:
+                    sftp.close()
+
+    def _discard(self, key: Tuple[str, str]) -> None:
+        with self._lock:
+            idle = self._idle.pop(key, [])
+            transport = self._transports.pop(key, None)
+        for sftp in idle:
+            sftp.close()
+        if transport is not None:
+            transport.close()
+
+    def close(self) -> None:
+        '''
+        Close all the sessions and transports of the pool.
+        '''
+        with self._lock:
+            keys = list(self._transports)
+        for key in keys:
+            self._discard(key)
+        return
+
+    def __enter__(self) -> SFTPPool:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+_pool = SFTPPool()
+
+def session(host: str, username: str, password: str)-> ContextManager[paramiko.SFTPClient]:
+    '''
+    Return a context manager yielding an SFTP session from the pool shared by the module, for example:
+        with sftp_utils.session(host, username, password) as sftp:
+            files = sftp_utils.collect_file_bytes(sftp, path)
+    '''
+    return _pool.session(host=host, username=username, password=password)
+
+def read_file(sftp: paramiko.SFTPClient, path: str, prefetch: bool=True)-> bytes:
+    '''
+    With prefetch, the blocks of the file are all requested at once instead of one read at a time.
+    '''
     with sftp.file(path, 'r') as file:
+        if prefetch:
+            file.prefetch()
         b = file.read()
     return b
 
@@ -24,11 +170,117 @@ def check_updates(time: datetime.datetime, sftp: paramiko.SFTPClient, folder_pat
         logging.info(m_time.time().strftime('%H:%M:%S'))
         return time <= m_time
 
-def collect_file_bytes(sftp: paramiko.SFTPClient, path: str='.')-> Dict[str, bytes]:
+class FolderSnapshot:
+    '''
+    Listing of the regular files of a remote folder as name -> (size, mtime), kept between polls to report only the files added or modified.
+    delivered holds the entries of the files already reported, entries the ones seen at the last poll.
+    '''
+    def __init__(self, path: str='.', entries: Dict[str, Tuple[int, int]]=None, delivered: Dict[str, Tuple[int, int]]=None) -> None:
+        self.path = path
+        self.entries = dict() if entries is None else {name: tuple(entry) for name, entry in entries.items()}
+        self.delivered = dict() if delivered is None else {name: tuple(entry) for name, entry in delivered.items()}
+
+    @staticmethod
+    def get_listing(sftp: paramiko.SFTPClient, path: str='.') -> Dict[str, Tuple[int, int]]:
+        return {attr.filename: (attr.st_size, attr.st_mtime) for attr in sftp.listdir_attr(path=path) if stat.S_ISREG(attr.st_mode)}
+
+    def poll(self, sftp: paramiko.SFTPClient, stable: bool=True) -> List[str]:
+        '''
+        List the folder and return the names of the files added or modified since they were last reported, marking them as reported.
+        With stable, a file is reported only once its size is the same in two consecutive polls, so that uploads still in progress are skipped until complete.
+        '''
+        current = FolderSnapshot.get_listing(sftp, path=self.path)
+        changed = [name for name, entry in current.items() if self.delivered.get(name) != entry]
+        if stable:
+            changed = [name for name in changed if name in self.entries and self.entries[name][0] == current[name][0]]
+        self.delivered = {name: entry for name, entry in self.delivered.items() if name in current}
+        for name in changed:
+            self.delivered[name] = current[name]
+        self.entries = current
+        return changed
+
+    def to_bytes(self) -> bytes:
+        return json.dumps({'path': self.path, 'entries': self.entries, 'delivered': self.delivered}, sort_keys=True).encode()
+
+    @staticmethod
+    def from_bytes(bytes: bytes) -> FolderSnapshot:
+        return FolderSnapshot(**json.loads(bytes))
+
+    @staticmethod
+    def load(local_path: str, path: str='.') -> FolderSnapshot:
+        '''
+        Read the snapshot saved in local_path, or return an empty snapshot of the remote path if there is none.
+        '''
+        if not os.path.exists(local_path):
+            return FolderSnapshot(path=path)
+        with open(local_path, 'rb') as file:
+            return FolderSnapshot.from_bytes(file.read())
+
+    def save(self, local_path: str) -> None:
+        with open(local_path, 'wb') as file:
+            file.write(self.to_bytes())
+        return
+
+def collect_file_bytes(sftp: paramiko.SFTPClient, path: str='.', workers: int=1)-> Dict[str, bytes]:
+    '''
+    Return a dictionary {file_name -> bytes} for the files in path. With more than one worker, they are downloaded by fetch_files.
+    '''
+    if workers > 1:
+        buffers: Dict[str, io.BytesIO] = dict()
+        fetch_files(sftp=sftp, sink=lambda file_name: buffers.setdefault(file_name, io.BytesIO()), path=path, workers=workers)
+        return {file_name: buffer.getvalue() for file_name, buffer in buffers.items()}
     files = sftp.listdir(path=path)
-    res = {file_name: read_file(sftp=sftp, path=file_name) for file_name in files}
+    res = {file_name: read_file(sftp=sftp, path=posixpath.join(path, file_name)) for file_name in files}
     return res
 
+def fetch_files(sftp: paramiko.SFTPClient, sink: Union[str, Callable[[str], BinaryIO]], path: str='.', workers: int=4, window_size: int=fetch_window_size, max_packet_size: int=fetch_max_packet_size, chunk_size: int=2**20)-> List[str]:
+    '''
+    Download the regular files in path by up to workers SFTP channels opened on the transport of sftp, each file being prefetched in pipelined requests.
+    sink is either a local directory, where the files are written with their names, or a function returning the writable binary object for each file name, which is left open.
+    Return the names of the files downloaded.
+    '''
+    if workers < 1:
+        raise ValueError(f'workers must be a positive integer. Got {workers}.')
+    files = [attr for attr in sftp.listdir_attr(path=path) if stat.S_ISREG(attr.st_mode)]
+    transport = sftp.get_channel().get_transport()
+    clients: Queue[paramiko.SFTPClient] = Queue()
+    opened = [paramiko.SFTPClient.from_transport(transport, window_size=window_size, max_packet_size=max_packet_size) for _ in range(min(workers, len(files)))]
+    for client in opened:
+        clients.put(client)
+    def fetch(attr: paramiko.SFTPAttributes) -> str:
+        client = clients.get()
+        try:
+            with client.open(posixpath.join(path, attr.filename), 'rb') as file:
+                file.prefetch(attr.st_size)
+                if isinstance(sink, str):
+                    with open(os.path.join(sink, attr.filename), 'wb') as target:
+                        shutil.copyfileobj(file, target, chunk_size)
+                else:
+                    shutil.copyfileobj(file, sink(attr.filename), chunk_size)
+        finally:
+            clients.put(client)
+        return attr.filename
+    try:
+        with ThreadPoolExecutor(max_workers=max(len(opened), 1)) as executor:
+            fetched = list(executor.map(fetch, files))
+    finally:
+        for client in opened:
+            client.close()
+    logging.info(f'{len(fetched)} files have been fetched from "{path}".')
+    return fetched
+
+def iter_file_streams(sftp: paramiko.SFTPClient, path: str='.', prefetch: bool=True)-> Iterator[Tuple[str, paramiko.SFTPFile]]:
+    '''
+    Yield (file_name, file) for the regular files in path, opened for binary reading one at a time; each file is closed when the next one is requested.
+    With prefetch, the blocks of the file are requested in the background as soon as it is opened.
+    '''
+    for attr in sftp.listdir_attr(path=path):
+        if stat.S_ISREG(attr.st_mode):
+            with sftp.open(posixpath.join(path, attr.filename), 'rb') as file:
+                if prefetch:
+                    file.prefetch(attr.st_size)
+                yield attr.filename, file
+
 def clear(sftp: paramiko.SFTPClient, path: str='.')-> None:
     files = sftp.listdir(path=path)
     for path in files:
@@ -0,0 +1,17 @@
+import pandas as pd
+from custom_package.filety import DataType as dt
+
+
+def test_decimal_series_consistency_matches_scalar():
+    data_type = dt.Decimal(2)
+    column = pd.Series(['1.5e16', '1.234', '-0.001', '1e20', 'x', None, '2.5e-05'], dtype=object)
+    _, consistent = data_type.parse_series(column)
+    assert consistent.tolist() == [data_type.is_consistent(value) for value in column]
+    assert consistent.tolist() == [False, True, True, True, False, True, True]
+
+
+def test_varchar_series_remediation_matches_scalar():
+    for data_type in [dt.Varchar(4), dt.Varchar(4, unspaced=True)]:
+        column = pd.Series(['a\xa0b\xa0', ' abc', 'x\u3000y', ' long text ', None], dtype=object)
+        assert data_type.remediate_series(column).tolist() == [data_type.remediate(value) for value in column]
+    assert dt.Varchar(4).remediate_series(pd.Series(['a\xa0b\xa0'])).tolist() == ['a b']
@@ -0,0 +1,54 @@
+from collections import OrderedDict
+from custom_package import cobol_utils
+
+
+def test_group_usage_applies_to_children():
+    columns = cobol_utils.parse_copybook('''
+       01 REC.
+          05 GRP USAGE COMP-3.
+             10 A PIC S9(5).
+             10 B PIC S9(3)V99.
+             10 C PIC X(2) DISPLAY.
+          05 D PIC X(3).
+''')
+    assert [(name, str(column), column.get_length()) for name, column in columns.items()] == \
+        [('A', 'Comp', 3), ('B', 'Comp', 3), ('C', 'Text', 2), ('D', 'Text', 3)]
+
+
+def test_identification_area_is_ignored():
+    lines = [
+        ('       01 REC.', 'REC00010'),
+        ('          05 A PIC X(4).', 'REC00020'),
+        ('000300    05 B PIC 9(2).', 'REC00030'),
+    ]
+    columns = cobol_utils.parse_copybook('\n'.join([code.ljust(72) + identification for code, identification in lines]))
+    assert [(name, column.get_length()) for name, column in columns.items()] == [('A', 4), ('B', 2)]
+
+
+def test_custom_decode_function_is_used():
+    custom = OrderedDict([('A', cobol_utils.Column('Text', 2, lambda b: 'CUSTOM', (2,)))])
+    standard = OrderedDict([('A', cobol_utils.Column.Text(2))])
+    data = 'ABCD'.encode('cp500')
+    assert cobol_utils.Ebcdic(data, standard).get_DataFrame()['A'].tolist() == ['AB', 'CD']
+    assert cobol_utils.Ebcdic(data, custom).get_DataFrame(workers=2)['A'].tolist() == ['CUSTOM', 'CUSTOM']
+    assert cobol_utils.RecordLayout.compile(custom) != cobol_utils.RecordLayout.compile(standard)
+
+
+def test_from_file_closes_the_memory_map(tmp_path):
+    path = tmp_path / 'records.dat'
+    path.write_bytes('ABCD'.encode('cp500'))
+    with cobol_utils.Ebcdic.from_file(path, OrderedDict([('A', cobol_utils.Column.Text(2))])) as ebcdic:
+        assert ebcdic.get_DataFrame()['A'].tolist() == ['AB', 'CD']
+        memory_map = ebcdic.get_bytes()
+    assert memory_map.closed
+
+
+def test_workers_decode_files_and_buffers_alike(tmp_path):
+    columns = OrderedDict([('A', cobol_utils.Column.Text(3)), ('B', cobol_utils.Column.Comp(3))])
+    data = b''.join(['{:03d}'.format(i % 1000).encode('cp500') + bytes.fromhex('{:03d}c'.format(i % 1000)) for i in range(3000)])
+    path = tmp_path / 'records.dat'
+    path.write_bytes(data)
+    expected = cobol_utils.Ebcdic(data, columns).get_DataFrame()
+    with cobol_utils.Ebcdic.from_file(path, columns) as ebcdic:
+        assert ebcdic.get_DataFrame(workers=3).equals(expected)
+    assert cobol_utils.Ebcdic(data, columns).get_DataFrame(workers=3).equals(expected)
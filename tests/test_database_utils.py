@@ -0,0 +1,174 @@
+import datetime
+import decimal
+import re
+import sqlite3
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyodbc', exc_type=ImportError)
+from custom_package import database_utils
+from custom_package.filety import DataType as dt
+
+
+class _Cursor:
+    '''
+    pyodbc-like cursor over an in-memory sqlite database, recording what is sent. MERGE, which sqlite lacks, is recorded only.
+    '''
+    def __init__(self, connection):
+        self.connection = connection
+        self.fast_executemany = False
+        self.arraysize = 1
+        self._cursor = connection.db.cursor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._cursor.close()
+
+    def execute(self, statement, *params):
+        self.connection.statements.append(statement)
+        if not statement.startswith('MERGE'):
+            self._cursor.execute(_to_sqlite_identifiers(statement), params)
+        return self
+
+    def executemany(self, statement, rows):
+        assert self.fast_executemany
+        self.connection.statements.append(statement)
+        self.connection.batches.append(rows)
+        self._cursor.executemany(_to_sqlite_identifiers(statement), [[_to_sqlite(value) for value in row] for row in rows])
+
+    @property
+    def description(self):
+        return [(column[0], self.connection.types.get(column[0], str)) + (None,) * 5 for column in self._cursor.description]
+
+    def fetchmany(self, size):
+        return [self._convert(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._convert(row) for row in self._cursor.fetchall()]
+
+    def _convert(self, row):
+        # sqlite returns datetimes as text
+        types = [self.connection.types.get(column[0], str) for column in self._cursor.description]
+        return tuple(datetime.datetime.fromisoformat(value) if type is datetime.datetime and value is not None else value for type, value in zip(types, row))
+
+
+def _to_sqlite_identifiers(statement):
+    # sqlite does not escape ] within brackets, so the identifiers are double-quoted instead
+    return re.sub(r'\[((?:[^\]]|\]\])*)\]', lambda m: '"' + m.group(1).replace(']]', ']').replace('"', '""') + '"', statement)
+
+
+def _to_sqlite(value):
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+class _Connection:
+    def __init__(self, types=None):
+        self.db = sqlite3.connect(':memory:')
+        self.types = dict() if types is None else types
+        self.statements = []
+        self.batches = []
+        self.commits = 0
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def commit(self):
+        self.commits += 1
+        self.db.commit()
+
+    def rollback(self):
+        self.db.rollback()
+
+
+_data_types = {'name': dt.Varchar(5), 'amount': dt.Decimal(2), 'day': dt.Date()}
+
+
+def _get_DataFrame():
+    return pd.DataFrame({'name': ['a', None, 'c', 'd', 'e'],
+        'amount': [1.5, np.nan, 2.346, 3.0, 4.0],
+        'day': ['2020-01-01', None, '2020-03-03', '2020-04-04', '2020-05-05']})
+
+
+def _get_query_connection():
+    cnxn = _Connection(types={'i': int, 'f': float, 't': datetime.datetime})
+    cnxn.db.execute('CREATE TABLE q (i, f, t, s)')
+    cnxn.db.executemany('INSERT INTO q VALUES (?, ?, ?, ?)', [(k if k >= 10 else None, k / 2 if k % 5 else None,
+        (datetime.datetime(2020, 1, 1) + datetime.timedelta(hours=k)).isoformat() if k % 3 else None, f'x{k}' if k % 4 else None) for k in range(25)])
+    return cnxn
+
+
+def test_iter_query_chunks_have_stable_dtypes():
+    cnxn = _get_query_connection()
+    chunks = list(database_utils.iter_query(cnxn, 'SELECT * FROM q', arraysize=10))
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+    assert all([chunk.dtypes.equals(chunks[0].dtypes) for chunk in chunks])
+    assert chunks[0]['i'].dtype == 'Int64' and chunks[0]['s'].dtype == object
+    df = pd.concat(chunks)
+    assert df.index.equals(pd.RangeIndex(25))
+    expected = database_utils.execute_query(cnxn, 'SELECT * FROM q')
+    assert df['t'].dtype == expected['t'].dtype
+    assert df['t'].equals(expected['t'])
+    assert df['i'].tolist()[9:11] == [pd.NA, 10]
+
+
+def test_iter_query_without_rows_yields_an_empty_DataFrame():
+    chunks = list(database_utils.iter_query(_get_query_connection(), 'SELECT * FROM q WHERE 0', arraysize=10))
+    assert len(chunks) == 1 and len(chunks[0]) == 0
+    assert chunks[0].dtypes.tolist()[:2] == ['Int64', 'float64']
+
+
+def test_sql_type_of_categorical_without_default():
+    assert database_utils.get_sql_type(dt.Categorical({'A', 'BB'}, np.nan, str.upper)) == 'NVARCHAR(2)'
+
+
+def test_write_table_commits_each_chunk():
+    cnxn = _Connection()
+    cnxn.db.execute('CREATE TABLE out (name, amount, day)')
+    assert database_utils.write_table(cnxn, _get_DataFrame(), 'out', data_types=_data_types, chunk_size=2) == 5
+    assert [len(batch) for batch in cnxn.batches] == [2, 2, 1]
+    assert cnxn.commits == 3
+    assert cnxn.db.execute('SELECT COUNT(*) FROM out').fetchone()[0] == 5
+
+
+def test_write_table_converts_parameters():
+    cnxn = _Connection()
+    cnxn.db.execute('CREATE TABLE out (name, amount, day)')
+    database_utils.write_table(cnxn, _get_DataFrame(), 'out', data_types=_data_types)
+    rows = cnxn.batches[0]
+    assert rows[0] == ('a', decimal.Decimal('1.50'), datetime.date(2020, 1, 1))
+    assert rows[1] == (None, None, None)
+    assert rows[2][1] == decimal.Decimal('2.35')
+    assert cnxn.statements[0] == 'INSERT INTO [out] ([name], [amount], [day]) VALUES (?, ?, ?)'
+
+
+def test_merge_statement():
+    cnxn = _Connection()
+    df = _get_DataFrame().rename(columns={'day': 'd]ay'})
+    data_types = {'name': _data_types['name'], 'amount': _data_types['amount'], 'd]ay': _data_types['day']}
+    database_utils.write_table(cnxn, df, 'dbo.out', data_types=data_types, NK=['name', 'd]ay'], merge=True, chunk_size=2)
+    create, merge, drop = cnxn.statements[0], cnxn.statements[-2], cnxn.statements[-1]
+    staging = create.split(' ')[2]
+    assert create == f'CREATE TABLE {staging} ([name] NVARCHAR(5), [amount] DECIMAL(38, 2), [d]]ay] DATE)'
+    assert merge == f'MERGE INTO [dbo].[out] AS target USING {staging} AS source'\
+        ' ON target.[name] = source.[name] AND target.[d]]ay] = source.[d]]ay]'\
+        ' WHEN MATCHED THEN UPDATE SET target.[amount] = source.[amount]'\
+        ' WHEN NOT MATCHED THEN INSERT ([name], [amount], [d]]ay]) VALUES (source.[name], source.[amount], source.[d]]ay]);'
+    assert drop == f'DROP TABLE {staging}'
+    assert [len(batch) for batch in cnxn.batches] == [2, 2, 1]
+
+
+def test_merge_without_update_when_all_columns_are_the_key():
+    cnxn = _Connection()
+    df = _get_DataFrame()[['name', 'day']].dropna()
+    database_utils.write_table(cnxn, df, 'out', data_types=_data_types, NK=['name', 'day'], merge=True)
+    merge = cnxn.statements[-2]
+    assert merge.startswith('MERGE INTO [out]')
+    assert 'UPDATE' not in merge
+    assert 'WHEN NOT MATCHED THEN INSERT ([name], [day])' in merge
@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+import pytest
+from custom_package import dataframe_utils as df_utils, exceptions
+
+
+def test_empty_index_round_trip():
+    index = df_utils.NKIndex.from_bytes(df_utils.NKIndex(['k']).to_bytes())
+    assert len(index) == 0
+    index.check(pd.DataFrame({'k': ['a', 'b']}))
+
+
+def test_adding_no_keys_keeps_index_usable():
+    index = df_utils.NKIndex(['k'])
+    index.update(pd.DataFrame({'k': pd.Series([], dtype=str)}))
+    index.update(pd.DataFrame({'k': ['a']}))
+    assert index.contains(pd.DataFrame({'k': ['a', 'b']})).tolist() == [True, False]
+
+
+def test_signed_zeros_are_the_same_key():
+    df = pd.DataFrame({'k': [0.0, -0.0]})
+    with pytest.raises(exceptions.DataException):
+        df_utils.check_multiple_NK(df, ['k'])
+    index = df_utils.NKIndex(['k'])
+    index.add(df.iloc[:1])
+    assert index.contains(df.iloc[1:]).tolist() == [True]
@@ -0,0 +1,111 @@
+import io
+import os
+import socket
+import threading
+import pytest
+
+paramiko = pytest.importorskip('paramiko')
+from custom_package import sftp_utils
+
+
+class _Server(paramiko.ServerInterface):
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+
+class _Handle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+class _SFTPInterface(paramiko.SFTPServerInterface):
+    '''
+    Read-only SFTP server on a local directory.
+    '''
+    def __init__(self, server, root):
+        super().__init__(server)
+        self.root = root
+
+    def _get_path(self, path):
+        return os.path.join(self.root, path.lstrip('/'))
+
+    def list_folder(self, path):
+        folder = self._get_path(path)
+        return [paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(folder, name)), name) for name in os.listdir(folder)]
+
+    def stat(self, path):
+        return paramiko.SFTPAttributes.from_stat(os.stat(self._get_path(path)))
+
+    lstat = stat
+
+    def canonicalize(self, path):
+        return '/' + os.path.normpath(path).lstrip('/.')
+
+    def open(self, path, flags, attr):
+        handle = _Handle(flags)
+        handle.readfile = open(self._get_path(path), 'rb')
+        return handle
+
+
+@pytest.fixture
+def sftp(tmp_path):
+    root = tmp_path / 'remote'
+    (root / 'in').mkdir(parents=True)
+    (root / 'in' / 'sub').mkdir()
+    for i in range(5):
+        (root / 'in' / f'f{i}.bin').write_bytes(os.urandom(200000 + i))
+    key = paramiko.RSAKey.generate(2048)
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(8)
+    transports = []
+    def serve():
+        while True:
+            try:
+                connection, _ = listener.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(connection)
+            transport.add_server_key(key)
+            transport.set_subsystem_handler('sftp', paramiko.SFTPServer, _SFTPInterface, str(root))
+            transport.start_server(server=_Server())
+            transports.append(transport)
+    threading.Thread(target=serve, daemon=True).start()
+    transport = paramiko.Transport(listener.getsockname())
+    transport.connect(username='user', password='password')
+    client = paramiko.SFTPClient.from_transport(transport)
+    yield client, root / 'in'
+    client.close()
+    transport.close()
+    listener.close()
+    for server_transport in transports:
+        server_transport.close()
+
+
+def test_fetch_files_to_local_directory(sftp, tmp_path):
+    client, remote = sftp
+    sink = tmp_path / 'local'
+    sink.mkdir()
+    fetched = sftp_utils.fetch_files(client, str(sink), path='in', workers=3)
+    assert sorted(fetched) == [f'f{i}.bin' for i in range(5)]
+    for name in fetched:
+        assert (sink / name).read_bytes() == (remote / name).read_bytes()
+
+
+def test_fetch_files_to_buffers(sftp):
+    client, remote = sftp
+    buffers = dict()
+    sftp_utils.fetch_files(client, lambda name: buffers.setdefault(name, io.BytesIO()), path='in', workers=2)
+    assert {name: buffer.getvalue() for name, buffer in buffers.items()} == {name: (remote / name).read_bytes() for name in buffers}
+    assert len(buffers) == 5
+
+
+def test_collect_file_bytes_in_parallel(sftp):
+    client, remote = sftp
+    assert sftp_utils.collect_file_bytes(client, path='in', workers=4) == {f'f{i}.bin': (remote / f'f{i}.bin').read_bytes() for i in range(5)}